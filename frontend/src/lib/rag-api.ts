@@ -139,6 +139,8 @@ export async function fetchDocuments(
 ): Promise<DocumentListResult> {
   const params = new URLSearchParams();
   params.set("limit", String(limit));
+  // 页面只展示列表，不用总数，省掉后端的 COUNT
+  params.set("withTotal", "false");
   if (status) {
     params.set("status", status);
   }
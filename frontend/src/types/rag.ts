@@ -147,7 +147,7 @@ export interface DocumentItem {
 
 export interface DocumentListResult {
   items: DocumentItem[];
-  total: number;
+  total: number | null; // withTotal=false 时为 null
 }
 
 export interface DocumentStatusResult {
@@ -259,4 +259,5 @@ export interface ChatSessionMessages {
 export interface ChatSessionsResult {
   items: ChatSession[];
   total: number;
+  nextCursor: string | null;
 }
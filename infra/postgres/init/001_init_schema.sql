@@ -70,7 +70,12 @@ CREATE TABLE IF NOT EXISTS mcp_skill_logs (
 );
 
 CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status);
-CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents(created_at DESC);
+-- 文档列表只看未删除的文档并按创建时间倒序分页，部分索引直接覆盖这个范围。
+-- 已有库补建：CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_documents_active_created_at
+--   ON documents(created_at DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_documents_active_created_at
+    ON documents(created_at DESC)
+    WHERE deleted_at IS NULL;
 CREATE INDEX IF NOT EXISTS idx_document_chunks_document_chunk ON document_chunks(document_id, chunk_index);
 CREATE INDEX IF NOT EXISTS idx_retrieval_logs_trace_id ON retrieval_logs(trace_id);
 CREATE INDEX IF NOT EXISTS idx_retrieval_logs_created_at ON retrieval_logs(created_at DESC);
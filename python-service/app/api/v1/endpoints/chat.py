@@ -1,245 +1,228 @@
-import json
+import asyncio
 import logging
 import time
-from uuid import uuid4
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import AsyncIterator, Awaitable, Callable, Coroutine
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from operator import attrgetter
+from secrets import token_hex
+from typing import Annotated
 
 import asyncpg
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field
+import msgspec
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
 from app.core.config import get_settings
-from app.core.database import db_conn_context, get_db_conn, get_optional_db_conn
-from app.core.response import success
+from app.core.database import db_conn_context, get_db_conn, optional_db_conn_context
+from app.core.response import fail, get_trace_id, success_response
 from app.domain.models_registry import _registry, model_supports
-from app.domain.rag_service import RAGExecutionError, SkillCallLog, get_rag_service
+from app.domain.rag_service import RAGExecutionError, SkillCallLog, UsageStats, get_rag_service
 from app.domain.tools.orchestrator import DeepThinkRunRecord, ToolRunRecord, get_tool_orchestrator
+from app.workers.chat_persist_worker import PersistJob, submit_persist_job
 
-router = APIRouter(prefix="/chat", tags=["chat"])
+router = APIRouter(prefix="/chat", tags=["chat"], default_response_class=ORJSONResponse)
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-
-class AskRequest(BaseModel):
-    question: str = Field(min_length=1, max_length=2000)
-    modelId: str = Field(min_length=1)
-    sessionId: str | None = None
+# 配置在进程内不变，请求路径上直接读模块级绑定
+_RAG_TOP_K = settings.rag_top_k
+_RAG_MIN_SCORE = settings.rag_min_score
+_MCP_ENABLED = settings.mcp_enabled
+_MCP_AUTO_CALL = settings.mcp_auto_call
+_MCP_MAX_STEPS = settings.mcp_max_steps
+_DEEP_THINK_ENABLED = settings.deep_think_enabled
+
+# 模块级常量：每次请求复用同一对象，不再重复构造字面量 dict
+_CHAT_UNAVAILABLE_MESSAGE = "问答服务暂时不可用，请稍后重试"
+_CHAT_MODEL_UNSUPPORTED_MESSAGE = "当前模型不可用于聊天"
+# 问题最多 2000 字（UTF-8 约 6KB），再给 documentIds 等字段留足余量
+_MAX_ASK_BODY_BYTES = 64 * 1024
+# 流式 token 合帧：攒够字数或等满间隔就下发一帧，首个片段不等
+_STREAM_FRAME_MAX_CHARS = 32
+_STREAM_FRAME_MAX_DELAY_SEC = 0.02
+# SSE 必须逐帧直达客户端：
+# - X-Accel-Buffering 关掉 nginx 缓冲；
+# - 显式声明 identity 编码，压缩中间件（含第三方 br/zstd 中间件）和代理看到已有 Content-Encoding 就不再攒包压缩；
+# - Transfer-Encoding 不手动设置，没有 Content-Length 时 uvicorn 自己走 chunked。
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+    "Content-Encoding": "identity",
+}
+
+
+class AskRequest(msgspec.Struct, frozen=True):
+    question: Annotated[str, msgspec.Meta(min_length=1, max_length=2000)]
+    modelId: Annotated[str, msgspec.Meta(min_length=1)]
+    sessionId: Annotated[str, msgspec.Meta(min_length=1)] | None = None
     embeddingModelId: str | None = None
     documentIds: list[str] | None = None
     useRag: bool = False
     enableTools: bool | None = None
     enableDeepThink: bool | None = None
-    maxToolSteps: int | None = Field(default=None, ge=1, le=12)
+    maxToolSteps: Annotated[int, msgspec.Meta(ge=1, le=12)] | None = None
+
+
+# 解码器单例：类型信息只编译一次，后续请求复用
+_ASK_REQUEST_DECODER = msgspec.json.Decoder(AskRequest)
+
+
+@dataclass(slots=True)
+class AskResponseData:
+    """
+    /chat/ask 响应体
+
+    说明：
+    - slots 去掉实例 __dict__，orjson 原生识别 dataclass，无需先转 dict。
+    - 字段名即接口字段名，保持与前端约定一致。
+    """
+
+    answer: str
+    sessionId: str
+    references: list[dict[str, object]]
+    toolRuns: list[dict[str, object]]
+    deepThinkSummary: str | None
+    deepThinkRuns: list[dict[str, object]]
+
+
+async def _decode_ask_request(request: Request) -> AskRequest:
+    """
+    解析问答请求体
+
+    说明：
+    - 直接用 msgspec 在 C 层完成类型与长度校验，跳过 Pydantic 的逐字段校验链。
+    - 校验失败统一转成 RequestValidationError，复用全局 422 响应结构。
+    - 先按字节数卡上限，超大请求体不进入 JSON 解码。
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit():
+        if int(content_length) > _MAX_ASK_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="请求体过大")
+    raw = await request.body()
+    if len(raw) > _MAX_ASK_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="请求体过大")
+    try:
+        return _ASK_REQUEST_DECODER.decode(raw)
+    except msgspec.ValidationError as exc:
+        raise RequestValidationError(
+            [{"type": "value_error", "loc": ["body"], "msg": str(exc)}]
+        ) from exc
+    except msgspec.DecodeError as exc:
+        raise RequestValidationError(
+            [{"type": "json_invalid", "loc": ["body"], "msg": str(exc)}]
+        ) from exc
 
 
 # ============== 聊天历史存储函数 ==============
 
-async def _save_chat_message(
-    conn: asyncpg.Connection,
-    session_id: str,
-    role: str,
-    content: str,
-    references: list[dict[str, object]] | None = None,
-) -> None:
-    """保存单条聊天消息"""
-    try:
-        await conn.execute(
-            """
-            INSERT INTO chat_messages (session_id, role, content, "references")
-            VALUES ($1, $2, $3, $4::jsonb)
-            """,
-            session_id,
-            role,
-            content,
-            json.dumps(references or [], ensure_ascii=False),
-        )
-    except Exception:
-        logger.exception("Failed to save chat message, session=%s", session_id)
-
-
-async def _ensure_session(
+# 写入 SQL 固定为模块常量：asyncpg 按 SQL 文本做每连接的预编译语句缓存，
+# 文本保持不变即可保证每条连接只 Parse 一次，之后直接 Bind/Execute。
+# 一轮对话整体落库：会话 upsert + 多条消息放进同一条写入式 CTE，一次往返且天然原子。
+# 外键在语句结束时校验，能看到同语句里刚 upsert 的会话；
+# 消息与可观测日志一样打包成一个 jsonb 数组参数在库里展开，BIGSERIAL id 按数组顺序分配，
+# 同一语句内 created_at 相同，读取时靠 id 保序
+_PERSIST_CHAT_TURN_SQL = """
+WITH session AS (
+    INSERT INTO chat_sessions (session_id, model_id, use_rag, title)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (session_id) DO UPDATE SET updated_at = NOW()
+    RETURNING session_id
+)
+INSERT INTO chat_messages (session_id, role, content, "references")
+SELECT session.session_id, message.role, message.content, message."references"
+FROM session, jsonb_to_recordset($5) AS message(role TEXT, content TEXT, "references" JSONB)
+"""
+
+
+async def _persist_chat_turn(
     conn: asyncpg.Connection,
     session_id: str,
     model_id: str,
     use_rag: bool,
-    title: str | None = None,
+    title: str | None,
+    messages: list[tuple[str, str, list[dict[str, object]]]],
 ) -> None:
-    """确保会话存在，不存在则创建"""
+    """
+    一次往返保存一轮对话：确保会话存在，并按顺序写入消息
+
+    Args:
+        messages: (role, content, references) 列表，按先后顺序排列
+    """
     try:
         await conn.execute(
-            """
-            INSERT INTO chat_sessions (session_id, model_id, use_rag, title)
-            VALUES ($1, $2, $3, $4)
-            ON CONFLICT (session_id) DO UPDATE SET updated_at = NOW()
-            """,
+            _PERSIST_CHAT_TURN_SQL,
             session_id,
             model_id,
             use_rag,
             title or "新对话",
-        )
-    except Exception:
-        logger.exception("Failed to ensure session, session=%s", session_id)
-
-
-async def _write_retrieval_log(
-    conn: asyncpg.Connection,
-    *,
-    trace_id: str,
-    session_id: str | None,
-    question: str,
-    model_id: str,
-    latency_ms: int,
-    prompt_tokens: int,
-    completion_tokens: int,
-    total_tokens: int,
-    mcp_call_count: int,
-    status: str,
-    error_message: str | None,
-    references: list[dict[str, object]],
-) -> int | None:
-    """写 retrieval 日志并返回主键，失败仅记录日志不打断主流程"""
-    try:
-        row = await conn.fetchrow(
-            """
-            INSERT INTO retrieval_logs (
-                trace_id,
-                session_id,
-                question,
-                model_id,
-                top_k,
-                threshold,
-                latency_ms,
-                prompt_tokens,
-                completion_tokens,
-                total_tokens,
-                mcp_call_count,
-                status,
-                error_message,
-                results
-            )
-            VALUES (
-                $1, $2, $3, $4, $5, $6, $7,
-                $8, $9, $10, $11, $12, $13, $14::jsonb
-            )
-            RETURNING id
-            """,
-            trace_id,
-            session_id,
-            question,
-            model_id,
-            settings.rag_top_k,
-            settings.rag_min_score,
-            latency_ms,
-            prompt_tokens,
-            completion_tokens,
-            total_tokens,
-            mcp_call_count,
-            status,
-            error_message,
-            json.dumps(references, ensure_ascii=False),
-        )
-        return int(row["id"]) if row else None
-    except Exception:
-        logger.exception("Failed to write retrieval_logs, trace_id=%s", trace_id)
-        return None
-
-
-async def _write_skill_logs(
-    conn: asyncpg.Connection,
-    *,
-    retrieval_log_id: int | None,
-    trace_id: str,
-    session_id: str | None,
-    skill_calls: list[SkillCallLog],
-) -> None:
-    """写 skill 调用日志，失败不打断主流程"""
-    if retrieval_log_id is None or not skill_calls:
-        return
-
-    try:
-        await conn.executemany(
-            """
-            INSERT INTO mcp_skill_logs (
-                retrieval_log_id,
-                trace_id,
-                session_id,
-                skill_name,
-                status,
-                latency_ms,
-                prompt_tokens,
-                completion_tokens,
-                total_tokens,
-                input_summary,
-                output_summary,
-                error_message
-            )
-            VALUES (
-                $1, $2, $3, $4, $5, $6,
-                $7, $8, $9, $10, $11, $12
-            )
-            """,
             [
-                (
-                    retrieval_log_id,
-                    trace_id,
-                    session_id,
-                    call.skill_name,
-                    call.status,
-                    call.latency_ms,
-                    call.prompt_tokens,
-                    call.completion_tokens,
-                    call.total_tokens,
-                    call.input_summary,
-                    call.output_summary,
-                    call.error_message,
-                )
-                for call in skill_calls
+                {"role": role, "content": content, "references": references}
+                for role, content, references in messages
             ],
         )
     except Exception:
-        logger.exception("Failed to write mcp_skill_logs, trace_id=%s", trace_id)
+        logger.exception("Failed to persist chat turn, session=%s", session_id)
+
+
+# 响应字段名与记录属性一一对应，getter 只建一次，逐条转换只剩一次 C 层取值 + zip
+_TOOL_RUN_KEYS = (
+    "toolName",
+    "source",
+    "status",
+    "latencyMs",
+    "promptTokens",
+    "completionTokens",
+    "totalTokens",
+    "inputSummary",
+    "outputSummary",
+    "outputPayload",
+    "errorMessage",
+)
+_tool_run_values = attrgetter(
+    "tool_name",
+    "source",
+    "status",
+    "latency_ms",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "input_summary",
+    "output_summary",
+    "output_payload",
+    "error_message",
+)
+_DEEP_THINK_RUN_KEYS = (
+    "stage",
+    "status",
+    "latencyMs",
+    "inputSummary",
+    "outputSummary",
+    "payload",
+    "errorMessage",
+)
+_deep_think_run_values = attrgetter(
+    "stage",
+    "status",
+    "latency_ms",
+    "input_summary",
+    "output_summary",
+    "payload",
+    "error_message",
+)
 
 
 def _tool_run_to_dict(item: ToolRunRecord) -> dict[str, object]:
-    return {
-        "toolName": item.tool_name,
-        "source": item.source,
-        "status": item.status,
-        "latencyMs": item.latency_ms,
-        "promptTokens": item.prompt_tokens,
-        "completionTokens": item.completion_tokens,
-        "totalTokens": item.total_tokens,
-        "inputSummary": item.input_summary,
-        "outputSummary": item.output_summary,
-        "outputPayload": item.output_payload,
-        "errorMessage": item.error_message,
-    }
+    return dict(zip(_TOOL_RUN_KEYS, _tool_run_values(item)))
 
 
 def _deep_think_run_to_dict(item: DeepThinkRunRecord) -> dict[str, object]:
-    return {
-        "stage": item.stage,
-        "status": item.status,
-        "latencyMs": item.latency_ms,
-        "inputSummary": item.input_summary,
-        "outputSummary": item.output_summary,
-        "payload": item.payload,
-        "errorMessage": item.error_message,
-    }
-
-
-def _to_skill_call_from_tool_run(item: ToolRunRecord) -> SkillCallLog:
-    return SkillCallLog(
-        skill_name=item.tool_name,
-        status=item.status,
-        latency_ms=item.latency_ms,
-        prompt_tokens=item.prompt_tokens,
-        completion_tokens=item.completion_tokens,
-        total_tokens=item.total_tokens,
-        input_summary=item.input_summary,
-        output_summary=item.output_summary,
-        error_message=item.error_message,
-    )
+    return dict(zip(_DEEP_THINK_RUN_KEYS, _deep_think_run_values(item)))
 
 
 def _to_skill_call_from_deep_think(item: DeepThinkRunRecord) -> SkillCallLog:
@@ -256,156 +239,391 @@ def _to_skill_call_from_deep_think(item: DeepThinkRunRecord) -> SkillCallLog:
     )
 
 
-async def _write_tool_runs(
-    conn: asyncpg.Connection,
-    *,
-    retrieval_log_id: int | None,
-    trace_id: str,
-    session_id: str | None,
-    tool_runs: list[ToolRunRecord],
-) -> None:
-    if not tool_runs:
-        return
+@dataclass(slots=True)
+class ObservabilityLog:
+    """一次问答的可观测日志：retrieval_logs 主记录 + skill/tool/deep_think 明细"""
+
+    trace_id: str
+    session_id: str | None
+    question: str
+    model_id: str
+    latency_ms: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    status: str
+    error_message: str | None
+    references: list[dict[str, object]]
+    skill_calls: list[SkillCallLog]
+    tool_runs: list[ToolRunRecord]
+    deep_think_runs: list[DeepThinkRunRecord]
+
+
+# 一条写入式 CTE 完成主记录 + 三类明细：明细各自打包成一个 jsonb 数组参数，
+# 在库里用 jsonb_to_recordset 展开，整次落库只有一次网络往返，且天然原子
+_OBSERVABILITY_INSERT_SQL = """
+WITH log AS (
+    INSERT INTO retrieval_logs (
+        trace_id,
+        session_id,
+        question,
+        model_id,
+        top_k,
+        threshold,
+        latency_ms,
+        prompt_tokens,
+        completion_tokens,
+        total_tokens,
+        mcp_call_count,
+        status,
+        error_message,
+        results
+    )
+    VALUES (
+        $1, $2, $3, $4, $5, $6, $7,
+        $8, $9, $10, $11, $12, $13, $14
+    )
+    RETURNING id
+),
+skill_rows AS (
+    INSERT INTO mcp_skill_logs (
+        retrieval_log_id,
+        trace_id,
+        session_id,
+        skill_name,
+        status,
+        latency_ms,
+        prompt_tokens,
+        completion_tokens,
+        total_tokens,
+        input_summary,
+        output_summary,
+        error_message
+    )
+    SELECT
+        log.id, $1, $2,
+        item.skill_name,
+        item.status,
+        item.latency_ms,
+        item.prompt_tokens,
+        item.completion_tokens,
+        item.total_tokens,
+        item.input_summary,
+        item.output_summary,
+        item.error_message
+    FROM log, jsonb_to_recordset($15) AS item(
+        skill_name TEXT,
+        status TEXT,
+        latency_ms INTEGER,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        total_tokens INTEGER,
+        input_summary TEXT,
+        output_summary TEXT,
+        error_message TEXT
+    )
+),
+tool_rows AS (
+    INSERT INTO tool_runs (
+        retrieval_log_id,
+        trace_id,
+        session_id,
+        tool_name,
+        source,
+        status,
+        latency_ms,
+        prompt_tokens,
+        completion_tokens,
+        total_tokens,
+        input_summary,
+        output_summary,
+        output_payload,
+        error_message
+    )
+    SELECT
+        log.id, $1, $2,
+        item.tool_name,
+        item.source,
+        item.status,
+        item.latency_ms,
+        item.prompt_tokens,
+        item.completion_tokens,
+        item.total_tokens,
+        item.input_summary,
+        item.output_summary,
+        item.output_payload,
+        item.error_message
+    FROM log, jsonb_to_recordset($16) AS item(
+        tool_name TEXT,
+        source TEXT,
+        status TEXT,
+        latency_ms INTEGER,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        total_tokens INTEGER,
+        input_summary TEXT,
+        output_summary TEXT,
+        output_payload JSONB,
+        error_message TEXT
+    )
+)
+INSERT INTO deep_think_runs (
+    retrieval_log_id,
+    trace_id,
+    session_id,
+    stage,
+    status,
+    latency_ms,
+    input_summary,
+    output_summary,
+    payload,
+    error_message
+)
+SELECT
+    log.id, $1, $2,
+    item.stage,
+    item.status,
+    item.latency_ms,
+    item.input_summary,
+    item.output_summary,
+    item.payload,
+    item.error_message
+FROM log, jsonb_to_recordset($17) AS item(
+    stage TEXT,
+    status TEXT,
+    latency_ms INTEGER,
+    input_summary TEXT,
+    output_summary TEXT,
+    payload JSONB,
+    error_message TEXT
+)
+"""
+
+
+async def _write_observability_logs(conn: asyncpg.Connection, log: ObservabilityLog) -> None:
+    """
+    一次往返写入一次问答的全部可观测日志
+
+    说明：
+    - retrieval_logs 主记录与 skill/tool/deep_think 明细由同一条 CTE 写入，单语句即原子。
+    - 明细 dataclass 字段名与表列名一致，orjson 直接按 dataclass 序列化成对象数组。
+    - 失败只记日志，不打断问答主流程。
+    """
     try:
-        await conn.executemany(
-            """
-            INSERT INTO tool_runs (
-                retrieval_log_id,
-                trace_id,
-                session_id,
-                tool_name,
-                source,
-                status,
-                latency_ms,
-                prompt_tokens,
-                completion_tokens,
-                total_tokens,
-                input_summary,
-                output_summary,
-                output_payload,
-                error_message
-            )
-            VALUES (
-                $1, $2, $3, $4, $5, $6,
-                $7, $8, $9, $10, $11, $12, $13::jsonb, $14
-            )
-            """,
-            [
-                (
-                    retrieval_log_id,
-                    trace_id,
-                    session_id,
-                    item.tool_name,
-                    item.source,
-                    item.status,
-                    item.latency_ms,
-                    item.prompt_tokens,
-                    item.completion_tokens,
-                    item.total_tokens,
-                    item.input_summary,
-                    item.output_summary,
-                    json.dumps(item.output_payload, ensure_ascii=False),
-                    item.error_message,
-                )
-                for item in tool_runs
-            ],
+        await conn.execute(
+            _OBSERVABILITY_INSERT_SQL,
+            log.trace_id,
+            log.session_id,
+            log.question,
+            log.model_id,
+            _RAG_TOP_K,
+            _RAG_MIN_SCORE,
+            log.latency_ms,
+            log.prompt_tokens,
+            log.completion_tokens,
+            log.total_tokens,
+            len(log.skill_calls),
+            log.status,
+            log.error_message,
+            log.references,
+            log.skill_calls,
+            log.tool_runs,
+            log.deep_think_runs,
         )
     except Exception:
-        logger.exception("Failed to write tool_runs, trace_id=%s", trace_id)
+        logger.exception("Failed to write observability logs, trace_id=%s", log.trace_id)
 
 
-async def _write_deep_think_runs(
-    conn: asyncpg.Connection,
-    *,
-    retrieval_log_id: int | None,
-    trace_id: str,
-    session_id: str | None,
-    deep_think_runs: list[DeepThinkRunRecord],
-) -> None:
-    if not deep_think_runs:
-        return
+# 后台日志任务需要持有强引用，否则可能在执行完之前被 GC 回收
+_background_tasks: set[asyncio.Task[None]] = set()
+
+
+def _spawn_background(coro: Coroutine[object, object, None]) -> asyncio.Task[None]:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _run_persist_job_detached(job: PersistJob) -> None:
     try:
-        await conn.executemany(
-            """
-            INSERT INTO deep_think_runs (
-                retrieval_log_id,
-                trace_id,
-                session_id,
-                stage,
-                status,
-                latency_ms,
-                input_summary,
-                output_summary,
-                payload,
-                error_message
-            )
-            VALUES (
-                $1, $2, $3, $4, $5, $6, $7, $8, $9::jsonb, $10
-            )
-            """,
-            [
-                (
-                    retrieval_log_id,
-                    trace_id,
-                    session_id,
-                    item.stage,
-                    item.status,
-                    item.latency_ms,
-                    item.input_summary,
-                    item.output_summary,
-                    json.dumps(item.payload, ensure_ascii=False),
-                    item.error_message,
-                )
-                for item in deep_think_runs
-            ],
-        )
+        async with db_conn_context() as conn:
+            await job.write(conn)
     except Exception:
-        logger.exception("Failed to write deep_think_runs, trace_id=%s", trace_id)
+        logger.warning("[%s] Chat persist skipped: db unavailable", job.trace_id)
+
+
+def _schedule_persist(
+    trace_id: str,
+    write: Callable[[asyncpg.Connection], Awaitable[None]],
+) -> None:
+    """
+    把响应后的落库挪出流式关键路径
+
+    说明：
+    - 客户端收到 done 后连接立即关闭，不用等历史和日志写完。
+    - 优先交给落库 Worker 的有界队列；Worker 未启动时退回独立后台任务，自己取连接。
+    - 不要在每个写入点各开一次 db_conn_context()：热路径上反复 acquire/release 的开销会叠加，
+      请求侧也不要为了"复用"把连接一直攥到流结束，LLM 生成期间会白占连接池名额。
+    """
+    job = PersistJob(trace_id=trace_id, write=write)
+    if not submit_persist_job(job):
+        _spawn_background(_run_persist_job_detached(job))
+
+
+def _schedule_observability_logs(log: ObservabilityLog) -> None:
+    """
+    失败日志同样走落库队列
+
+    说明：
+    - 异常分支不再自己取连接写库：DB 故障时每次 acquire 都要等到超时，error 帧会被拖慢。
+    - 入队后立即下发 error 帧，写入和 DB 不可用时的告警都由 Worker 负责。
+    """
+    _schedule_persist(log.trace_id, partial(_write_observability_logs, log=log))
 
 
-def _sse_event(event: str, data: dict[str, object]) -> str:
-    payload = json.dumps(data, ensure_ascii=False)
-    return f"event: {event}\ndata: {payload}\n\n"
+def _sse_event(event: str, data: dict[str, object]) -> bytes:
+    """
+    直接拼 bytes，StreamingResponse 不再逐帧做 str -> UTF-8 编码
 
+    说明：
+    - 用 join 一次分配出整帧，不产生连续 + 拼接时的中间 bytes。
+    """
+    return b"".join((b"event: ", event.encode(), b"\ndata: ", orjson.dumps(data), b"\n\n"))
 
-def _chunk_text(text: str, size: int = 24) -> list[str]:
+
+_SSE_CHUNK_PREFIX = b'event: chunk\ndata: {"text":'
+_SSE_CHUNK_SUFFIX = b"}\n\n"
+
+
+def _sse_chunk(text: str) -> bytes:
+    """chunk 帧专用快路径：只有一个 text 字段，省掉 dict 构造和通用序列化"""
+    return b"".join((_SSE_CHUNK_PREFIX, orjson.dumps(text), _SSE_CHUNK_SUFFIX))
+
+
+def _chunk_text(text: str, size: int = 256, single_frame_limit: int = 512) -> list[str]:
+    """
+    把已生成好的完整回答切成 SSE 分片
+
+    说明：
+    - RAG 分支是整段答案生成后再下发，分片只是为了前端渐进渲染，切太细只会多出帧开销。
+    - 短回答直接一帧下发；长回答按 size 切，帧数比原来 24 字一片少约 10 倍。
+    """
     if not text:
         return []
+    if len(text) <= single_frame_limit:
+        return [text]
     return [text[index : index + size] for index in range(0, len(text), size)]
 
 
-def _parse_references(value: object) -> list[dict[str, object]]:
-    """兼容 asyncpg 对 jsonb 的不同解码行为"""
-    if isinstance(value, list):
-        return [item for item in value if isinstance(item, dict)]
-    if isinstance(value, str):
-        try:
-            parsed = json.loads(value)
-            if isinstance(parsed, list):
-                return [item for item in parsed if isinstance(item, dict)]
-        except Exception:
-            return []
-    return []
+async def _next_piece(pieces: AsyncIterator[str]) -> str | None:
+    try:
+        return await anext(pieces)
+    except StopAsyncIteration:
+        return None
+
+
+async def _coalesce_pieces(
+    pieces: AsyncIterator[str],
+    max_chars: int = _STREAM_FRAME_MAX_CHARS,
+    max_delay: float = _STREAM_FRAME_MAX_DELAY_SEC,
+) -> AsyncIterator[str]:
+    """
+    把 LLM 逐 token 的细碎片段合并成较大的 SSE 帧
+
+    说明：
+    - 首个片段立即下发，首字延迟不变；之后攒够 max_chars 或等满 max_delay 就下发一帧。
+    - 缓冲为空时直接 await 上游，不额外建任务；只有需要计时才把 __anext__ 挂成任务。
+    - 超时不取消挂起的 __anext__：取消会把上游异步生成器直接关掉，下一轮接着等同一个任务。
+    """
+    clock = asyncio.get_running_loop().time
+    buffer: list[str] = []
+    append = buffer.append
+    buffered_chars = 0
+    deadline = 0.0
+    pending: asyncio.Task[str | None] | None = None
+    first = True
+    try:
+        while True:
+            if pending is None and not buffer:
+                piece = await _next_piece(pieces)
+            else:
+                if pending is None:
+                    pending = asyncio.ensure_future(_next_piece(pieces))
+                # 缓冲已在超时时清空、只剩挂起任务时，不再计时，直接等下一个片段
+                timeout = max(deadline - clock(), 0.0) if buffer else None
+                done, _ = await asyncio.wait((pending,), timeout=timeout)
+                if not done:
+                    yield "".join(buffer)
+                    buffer.clear()
+                    buffered_chars = 0
+                    continue
+                piece, pending = pending.result(), None
+            if piece is None:
+                break
+            if first:
+                first = False
+                yield piece
+                continue
+            if not buffer:
+                deadline = clock() + max_delay
+            append(piece)
+            buffered_chars += len(piece)
+            if buffered_chars >= max_chars:
+                yield "".join(buffer)
+                buffer.clear()
+                buffered_chars = 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+
+
+def _unsupported_model_response(trace_id: str) -> ORJSONResponse:
+    """
+    模型不可用于聊天时的 400 响应
+
+    说明：
+    - 这是最常见的业务拒绝，直接返回响应，不走抛异常 + 全局处理器的展开路径。
+    - traceId 每次不同，响应体无法整体预生成，消息文本复用模块常量。
+    """
+    return ORJSONResponse(
+        fail(trace_id=trace_id, message=_CHAT_MODEL_UNSUPPORTED_MESSAGE, code=400),
+        status_code=400,
+    )
 
 
-@router.post("/ask")
-async def ask_question(
+async def ask_question(request: Request) -> ORJSONResponse:
+    """
+    非流式问答（原生 Starlette 路由）
+
+    说明：
+    - 不经过 FastAPI 的依赖注入与响应模型管线，请求体自行解码、响应直接交给 orjson。
+    - 先解码、校验模型再取连接，参数不合法时不占用连接池。
+    """
+    payload = await _decode_ask_request(request)
+    trace_id = get_trace_id(request)
+    if not model_supports(payload.modelId, "chat"):
+        return _unsupported_model_response(trace_id)
+    async with optional_db_conn_context() as conn:
+        return await _answer_question(trace_id, payload, conn)
+
+
+async def _answer_question(
+    trace_id: str,
     payload: AskRequest,
-    request: Request,
-    conn: asyncpg.Connection | None = Depends(get_optional_db_conn),
-) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    conn: asyncpg.Connection | None,
+) -> ORJSONResponse:
     start_time = time.monotonic()
-    enable_tools = payload.enableTools if payload.enableTools is not None else settings.mcp_auto_call
+    enable_tools = payload.enableTools if payload.enableTools is not None else _MCP_AUTO_CALL
     enable_deep_think = (
         payload.enableDeepThink
         if payload.enableDeepThink is not None
-        else settings.deep_think_enabled
+        else _DEEP_THINK_ENABLED
     )
-    max_tool_steps = payload.maxToolSteps or settings.mcp_max_steps
-
-    if not model_supports(payload.modelId, "chat"):
-        raise HTTPException(status_code=400, detail="当前模型不可用于聊天")
+    max_tool_steps = payload.maxToolSteps or _MCP_MAX_STEPS
 
     if payload.useRag and conn is None:
         raise HTTPException(status_code=503, detail="数据库未就绪，暂时无法使用 RAG 检索")
@@ -421,7 +639,7 @@ async def ask_question(
     deep_think_summary: str | None = None
 
     try:
-        if conn is not None and settings.mcp_enabled and (enable_tools or enable_deep_think):
+        if conn is not None and _MCP_ENABLED and (enable_tools or enable_deep_think):
             orchestrator = get_tool_orchestrator()
             orchestration = await orchestrator.orchestrate(
                 conn,
@@ -435,23 +653,9 @@ async def ask_question(
             tool_runs = orchestration.tool_runs
             deep_think_runs = orchestration.deep_think_runs
             deep_think_summary = orchestration.deep_think_summary
-            orchestration_skill_calls = [
-                SkillCallLog(
-                    skill_name=item.skill_name,
-                    status=item.status,
-                    latency_ms=item.latency_ms,
-                    prompt_tokens=item.prompt_tokens,
-                    completion_tokens=item.completion_tokens,
-                    total_tokens=item.total_tokens,
-                    input_summary=item.input_summary,
-                    output_summary=item.output_summary,
-                    error_message=item.error_message,
-                )
-                for item in orchestration.skill_calls
-            ]
-            orchestration_skill_calls.extend(
-                [_to_skill_call_from_deep_think(item) for item in deep_think_runs]
-            )
+            # 编排结果每次调用新建，直接沿用它的 skill_calls 列表，深度思考记录惰性追加，不再拷一份
+            orchestration_skill_calls = orchestration.skill_calls
+            orchestration_skill_calls.extend(map(_to_skill_call_from_deep_think, deep_think_runs))
 
         rag_service = get_rag_service()
         if payload.useRag:
@@ -483,52 +687,39 @@ async def ask_question(
         )
 
         if conn is not None:
-            retrieval_log_id = await _write_retrieval_log(
-                conn,
-                trace_id=trace_id,
-                session_id=result.session_id,
-                question=payload.question,
-                model_id=result.model_id,
-                latency_ms=latency_ms,
-                prompt_tokens=result.prompt_tokens,
-                completion_tokens=result.completion_tokens,
-                total_tokens=result.total_tokens,
-                mcp_call_count=len(merged_skill_calls),
-                status="success",
-                error_message=None,
-                references=result.references,
-            )
-            await _write_skill_logs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=result.session_id,
-                skill_calls=merged_skill_calls,
-            )
-            await _write_tool_runs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=result.session_id,
-                tool_runs=tool_runs,
-            )
-            await _write_deep_think_runs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=result.session_id,
-                deep_think_runs=deep_think_runs,
+            # 日志交给落库 Worker，写在它常驻的连接上，不再每个请求额外从池里取一次连接
+            _schedule_persist(
+                trace_id,
+                partial(
+                    _write_observability_logs,
+                    log=ObservabilityLog(
+                        trace_id=trace_id,
+                        session_id=result.session_id,
+                        question=payload.question,
+                        model_id=result.model_id,
+                        latency_ms=latency_ms,
+                        prompt_tokens=result.prompt_tokens,
+                        completion_tokens=result.completion_tokens,
+                        total_tokens=result.total_tokens,
+                        status="success",
+                        error_message=None,
+                        references=result.references,
+                        skill_calls=merged_skill_calls,
+                        tool_runs=tool_runs,
+                        deep_think_runs=deep_think_runs,
+                    ),
+                ),
             )
 
-        return success(
-            {
-                "answer": result.answer,
-                "sessionId": result.session_id,
-                "references": result.references,
-                "toolRuns": [_tool_run_to_dict(item) for item in tool_runs],
-                "deepThinkSummary": deep_think_summary,
-                "deepThinkRuns": [_deep_think_run_to_dict(item) for item in deep_think_runs],
-            },
+        return success_response(
+            AskResponseData(
+                answer=result.answer,
+                sessionId=result.session_id,
+                references=result.references,
+                toolRuns=[_tool_run_to_dict(item) for item in tool_runs],
+                deepThinkSummary=deep_think_summary,
+                deepThinkRuns=[_deep_think_run_to_dict(item) for item in deep_think_runs],
+            ),
             trace_id,
         )
 
@@ -540,182 +731,99 @@ async def ask_question(
         latency_ms = int((time.monotonic() - start_time) * 1000)
         logger.exception("[%s] Chat execution failed: %s", trace_id, exc)
         if conn is not None:
-            retrieval_log_id = await _write_retrieval_log(
-                conn,
-                trace_id=trace_id,
-                session_id=exc.session_id,
-                question=payload.question,
-                model_id=exc.model_id,
-                latency_ms=latency_ms,
-                prompt_tokens=exc.prompt_tokens,
-                completion_tokens=exc.completion_tokens,
-                total_tokens=exc.total_tokens,
-                mcp_call_count=len(orchestration_skill_calls) + len(exc.skill_calls),
-                status="failed",
-                error_message=str(exc),
-                references=[],
-            )
-            merged_error_skill_calls = [*orchestration_skill_calls, *exc.skill_calls]
-            await _write_skill_logs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=exc.session_id,
-                skill_calls=merged_error_skill_calls,
-            )
-            await _write_tool_runs(
+            await _write_observability_logs(
                 conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=exc.session_id,
-                tool_runs=tool_runs,
-            )
-            await _write_deep_think_runs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=exc.session_id,
-                deep_think_runs=deep_think_runs,
+                ObservabilityLog(
+                    trace_id=trace_id,
+                    session_id=exc.session_id,
+                    question=payload.question,
+                    model_id=exc.model_id,
+                    latency_ms=latency_ms,
+                    prompt_tokens=exc.prompt_tokens,
+                    completion_tokens=exc.completion_tokens,
+                    total_tokens=exc.total_tokens,
+                    status="failed",
+                    error_message=str(exc),
+                    references=[],
+                    skill_calls=[*orchestration_skill_calls, *exc.skill_calls],
+                    tool_runs=tool_runs,
+                    deep_think_runs=deep_think_runs,
+                ),
             )
-        raise HTTPException(status_code=500, detail="问答服务暂时不可用，请稍后重试") from exc
+        raise HTTPException(status_code=500, detail=_CHAT_UNAVAILABLE_MESSAGE) from exc
 
     except Exception as exc:
         logger.exception("[%s] Chat query failed: %s", trace_id, exc)
         latency_ms = int((time.monotonic() - start_time) * 1000)
         if conn is not None:
-            retrieval_log_id = await _write_retrieval_log(
-                conn,
-                trace_id=trace_id,
-                session_id=payload.sessionId,
-                question=payload.question,
-                model_id=payload.modelId,
-                latency_ms=latency_ms,
-                prompt_tokens=0,
-                completion_tokens=0,
-                total_tokens=0,
-                mcp_call_count=len(orchestration_skill_calls),
-                status="failed",
-                error_message=str(exc),
-                references=[],
-            )
-            await _write_skill_logs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=payload.sessionId,
-                skill_calls=orchestration_skill_calls,
-            )
-            await _write_tool_runs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=payload.sessionId,
-                tool_runs=tool_runs,
-            )
-            await _write_deep_think_runs(
+            await _write_observability_logs(
                 conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=payload.sessionId,
-                deep_think_runs=deep_think_runs,
+                ObservabilityLog(
+                    trace_id=trace_id,
+                    session_id=payload.sessionId,
+                    question=payload.question,
+                    model_id=payload.modelId,
+                    latency_ms=latency_ms,
+                    prompt_tokens=0,
+                    completion_tokens=0,
+                    total_tokens=0,
+                    status="failed",
+                    error_message=str(exc),
+                    references=[],
+                    skill_calls=orchestration_skill_calls,
+                    tool_runs=tool_runs,
+                    deep_think_runs=deep_think_runs,
+                ),
             )
-        raise HTTPException(status_code=500, detail="问答服务暂时不可用，请稍后重试") from exc
+        raise HTTPException(status_code=500, detail=_CHAT_UNAVAILABLE_MESSAGE) from exc
 
 
-@router.post("/ask-stream")
 async def ask_question_stream(
-    payload: AskRequest,
     request: Request,
-) -> StreamingResponse:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
-    enable_tools = payload.enableTools if payload.enableTools is not None else settings.mcp_auto_call
+    payload: AskRequest = Depends(_decode_ask_request),
+) -> Response:
+    trace_id = get_trace_id(request)
+    enable_tools = payload.enableTools if payload.enableTools is not None else _MCP_AUTO_CALL
     enable_deep_think = (
         payload.enableDeepThink
         if payload.enableDeepThink is not None
-        else settings.deep_think_enabled
+        else _DEEP_THINK_ENABLED
     )
-    max_tool_steps = payload.maxToolSteps or settings.mcp_max_steps
+    max_tool_steps = payload.maxToolSteps or _MCP_MAX_STEPS
 
     if not model_supports(payload.modelId, "chat"):
-        raise HTTPException(status_code=400, detail="当前模型不可用于聊天")
+        return _unsupported_model_response(trace_id)
 
-    session_id = payload.sessionId or f"session-{uuid4().hex[:8]}"
+    # 空字符串已在解码阶段拒绝，这里只需判 None
+    session_id = (
+        payload.sessionId if payload.sessionId is not None else f"session-{token_hex(4)}"
+    )
     use_rag = payload.useRag
 
-    async def event_generator():
+    # 会话标题只依赖请求体，在生成器外算一次，生成器闭包直接引用
+    title = f"{payload.question[:30]}..." if len(payload.question) > 30 else payload.question
+
+    async def event_generator() -> AsyncIterator[bytes]:
+        # 每一帧都是现成的 UTF-8 bytes，StreamingResponse 原样写出，不再逐帧编码
         rag_service = get_rag_service()
         full_answer = ""
         references: list[dict[str, object]] = []
-        title = payload.question[:30] + ("..." if len(payload.question) > 30 else "")
         start_time = time.monotonic()
         model_id = payload.modelId
+        # chat-only 成功/失败分支共用同一摘要，只拼一次
+        chat_only_summary = f"model={model_id},mode=chat-only"
         skill_calls: list[SkillCallLog] = []
         orchestration_skill_calls: list[SkillCallLog] = []
         tool_runs: list[ToolRunRecord] = []
         deep_think_runs: list[DeepThinkRunRecord] = []
         deep_think_summary: str | None = None
         rewritten_question = payload.question
-        usage_stats = {
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "total_tokens": 0,
-        }
+        usage_stats = UsageStats()
         llm_start_time: float | None = None
         log_written = False
 
-        async def persist_observability_logs(
-            conn: asyncpg.Connection,
-            *,
-            session_id_for_log: str | None,
-            model_id_for_log: str,
-            prompt_tokens: int,
-            completion_tokens: int,
-            total_tokens: int,
-            status: str,
-            error_message: str | None,
-            references_for_log: list[dict[str, object]],
-            skill_calls_for_log: list[SkillCallLog],
-            tool_runs_for_log: list[ToolRunRecord],
-            deep_think_runs_for_log: list[DeepThinkRunRecord],
-        ) -> None:
-            nonlocal log_written
-            retrieval_log_id = await _write_retrieval_log(
-                conn,
-                trace_id=trace_id,
-                session_id=session_id_for_log,
-                question=payload.question,
-                model_id=model_id_for_log,
-                latency_ms=int((time.monotonic() - start_time) * 1000),
-                prompt_tokens=prompt_tokens,
-                completion_tokens=completion_tokens,
-                total_tokens=total_tokens,
-                mcp_call_count=len(skill_calls_for_log),
-                status=status,
-                error_message=error_message,
-                references=references_for_log,
-            )
-            await _write_skill_logs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=session_id_for_log,
-                skill_calls=skill_calls_for_log,
-            )
-            await _write_tool_runs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=session_id_for_log,
-                tool_runs=tool_runs_for_log,
-            )
-            await _write_deep_think_runs(
-                conn,
-                retrieval_log_id=retrieval_log_id,
-                trace_id=trace_id,
-                session_id=session_id_for_log,
-                deep_think_runs=deep_think_runs_for_log,
-            )
-            log_written = True
+        def elapsed_ms() -> int:
+            return int((time.monotonic() - start_time) * 1000)
 
         try:
             if use_rag:
@@ -728,7 +836,7 @@ async def ask_question_stream(
 
                 try:
                     async with db_conn_context() as rag_conn:
-                        if settings.mcp_enabled and (enable_tools or enable_deep_think):
+                        if _MCP_ENABLED and (enable_tools or enable_deep_think):
                             orchestrator = get_tool_orchestrator()
                             orchestration = await orchestrator.orchestrate(
                                 rag_conn,
@@ -742,23 +850,9 @@ async def ask_question_stream(
                             tool_runs = orchestration.tool_runs
                             deep_think_runs = orchestration.deep_think_runs
                             deep_think_summary = orchestration.deep_think_summary
-                            orchestration_skill_calls = [
-                                SkillCallLog(
-                                    skill_name=item.skill_name,
-                                    status=item.status,
-                                    latency_ms=item.latency_ms,
-                                    prompt_tokens=item.prompt_tokens,
-                                    completion_tokens=item.completion_tokens,
-                                    total_tokens=item.total_tokens,
-                                    input_summary=item.input_summary,
-                                    output_summary=item.output_summary,
-                                    error_message=item.error_message,
-                                )
-                                for item in orchestration.skill_calls
-                            ]
-                            orchestration_skill_calls.extend(
-                                [_to_skill_call_from_deep_think(item) for item in deep_think_runs]
-                            )
+                            # 编排结果每次调用新建，直接沿用它的 skill_calls 列表，深度思考记录惰性追加，不再拷一份
+                            orchestration_skill_calls = orchestration.skill_calls
+                            orchestration_skill_calls.extend(map(_to_skill_call_from_deep_think, deep_think_runs))
                         result = await rag_service.ask(
                             question=rewritten_question,
                             model_id=payload.modelId,
@@ -772,30 +866,6 @@ async def ask_question_stream(
                         skill_calls = [*orchestration_skill_calls, *result.skill_calls]
                         full_answer = result.answer
                         references = result.references
-
-                        await _ensure_session(rag_conn, session_id, payload.modelId, use_rag, title)
-                        await _save_chat_message(rag_conn, session_id, "user", payload.question)
-                        await _save_chat_message(
-                            rag_conn,
-                            session_id,
-                            "assistant",
-                            full_answer,
-                            references,
-                        )
-                        await persist_observability_logs(
-                            rag_conn,
-                            session_id_for_log=result.session_id,
-                            model_id_for_log=result.model_id,
-                            prompt_tokens=result.prompt_tokens,
-                            completion_tokens=result.completion_tokens,
-                            total_tokens=result.total_tokens,
-                            status="success",
-                            error_message=None,
-                            references_for_log=references,
-                            skill_calls_for_log=skill_calls,
-                            tool_runs_for_log=tool_runs,
-                            deep_think_runs_for_log=deep_think_runs,
-                        )
                 except RuntimeError as exc:
                     if isinstance(exc, RAGExecutionError):
                         raise
@@ -804,8 +874,44 @@ async def ask_question_stream(
                         detail="数据库未就绪，暂时无法使用 RAG 检索",
                     ) from exc
 
+                rag_log = ObservabilityLog(
+                    trace_id=trace_id,
+                    session_id=result.session_id,
+                    question=payload.question,
+                    model_id=result.model_id,
+                    latency_ms=elapsed_ms(),
+                    prompt_tokens=result.prompt_tokens,
+                    completion_tokens=result.completion_tokens,
+                    total_tokens=result.total_tokens,
+                    status="success",
+                    error_message=None,
+                    references=references,
+                    skill_calls=skill_calls,
+                    tool_runs=tool_runs,
+                    deep_think_runs=deep_think_runs,
+                )
+
+                async def persist_rag_turn(conn: asyncpg.Connection) -> None:
+                    # 与 chat-only 分支一致：成功后整轮（会话 + 问答两条消息）一条语句原子写入
+                    await _persist_chat_turn(
+                        conn,
+                        session_id,
+                        payload.modelId,
+                        use_rag,
+                        title,
+                        [
+                            ("user", payload.question, []),
+                            ("assistant", full_answer, references),
+                        ],
+                    )
+                    await _write_observability_logs(conn, rag_log)
+
+                # 历史和日志交给落库 Worker，chunk/done 不再排在 DB 往返后面
+                _schedule_persist(trace_id, persist_rag_turn)
+                log_written = True
+
                 for piece in _chunk_text(result.answer):
-                    yield _sse_event("chunk", {"text": piece})
+                    yield _sse_chunk(piece)
                 yield _sse_event(
                     "done",
                     {
@@ -818,7 +924,7 @@ async def ask_question_stream(
                     },
                 )
             else:
-                if settings.mcp_enabled and (enable_tools or enable_deep_think):
+                if _MCP_ENABLED and (enable_tools or enable_deep_think):
                     try:
                         async with db_conn_context() as tool_conn:
                             orchestrator = get_tool_orchestrator()
@@ -834,23 +940,9 @@ async def ask_question_stream(
                             tool_runs = orchestration.tool_runs
                             deep_think_runs = orchestration.deep_think_runs
                             deep_think_summary = orchestration.deep_think_summary
-                            orchestration_skill_calls = [
-                                SkillCallLog(
-                                    skill_name=item.skill_name,
-                                    status=item.status,
-                                    latency_ms=item.latency_ms,
-                                    prompt_tokens=item.prompt_tokens,
-                                    completion_tokens=item.completion_tokens,
-                                    total_tokens=item.total_tokens,
-                                    input_summary=item.input_summary,
-                                    output_summary=item.output_summary,
-                                    error_message=item.error_message,
-                                )
-                                for item in orchestration.skill_calls
-                            ]
-                            orchestration_skill_calls.extend(
-                                [_to_skill_call_from_deep_think(item) for item in deep_think_runs]
-                            )
+                            # 编排结果每次调用新建，直接沿用它的 skill_calls 列表，深度思考记录惰性追加，不再拷一份
+                            orchestration_skill_calls = orchestration.skill_calls
+                            orchestration_skill_calls.extend(map(_to_skill_call_from_deep_think, deep_think_runs))
                     except Exception as exc:
                         logger.warning(
                             "[%s] Tool orchestration skipped in stream chat-only: %s",
@@ -858,14 +950,22 @@ async def ask_question_stream(
                             exc,
                         )
                 llm_start_time = time.monotonic()
-                async for piece in rag_service.chat_only_stream(
-                    question=rewritten_question,
-                    model_id=payload.modelId,
-                    registry=_registry,
-                    usage_sink=usage_stats,
+                # 片段先收进列表，流结束后 join 一次；+= 在有其他引用时会退化成整串复制
+                answer_pieces: list[str] = []
+                # 逐帧循环里用局部别名，省掉每轮的全局查找和方法绑定
+                append_piece = answer_pieces.append
+                sse_chunk = _sse_chunk
+                async for piece in _coalesce_pieces(
+                    rag_service.chat_only_stream(
+                        question=rewritten_question,
+                        model_id=payload.modelId,
+                        registry=_registry,
+                        usage_sink=usage_stats,
+                    )
                 ):
-                    full_answer += piece
-                    yield _sse_event("chunk", {"text": piece})
+                    append_piece(piece)
+                    yield sse_chunk(piece)
+                full_answer = "".join(answer_pieces)
 
                 llm_latency_ms = int((time.monotonic() - llm_start_time) * 1000)
                 skill_calls = [
@@ -874,10 +974,10 @@ async def ask_question_stream(
                         skill_name="mcp.llm.generate",
                         status="success",
                         latency_ms=llm_latency_ms,
-                        prompt_tokens=usage_stats["prompt_tokens"],
-                        completion_tokens=usage_stats["completion_tokens"],
-                        total_tokens=usage_stats["total_tokens"],
-                        input_summary=f"model={payload.modelId},mode=chat-only",
+                        prompt_tokens=usage_stats.prompt_tokens,
+                        completion_tokens=usage_stats.completion_tokens,
+                        total_tokens=usage_stats.total_tokens,
+                        input_summary=chat_only_summary,
                         output_summary=f"answer_chars={len(full_answer)}",
                     )
                 ]
@@ -893,68 +993,66 @@ async def ask_question_stream(
                     },
                 )
 
-                try:
-                    async with db_conn_context() as history_conn:
-                        await _ensure_session(history_conn, session_id, payload.modelId, use_rag, title)
-                        await _save_chat_message(history_conn, session_id, "user", payload.question)
-                        await _save_chat_message(
-                            history_conn,
-                            session_id,
-                            "assistant",
-                            full_answer,
-                            references,
-                        )
-                        await persist_observability_logs(
-                            history_conn,
-                            session_id_for_log=session_id,
-                            model_id_for_log=payload.modelId,
-                            prompt_tokens=usage_stats["prompt_tokens"],
-                            completion_tokens=usage_stats["completion_tokens"],
-                            total_tokens=usage_stats["total_tokens"],
-                            status="success",
-                            error_message=None,
-                            references_for_log=[],
-                            skill_calls_for_log=skill_calls,
-                            tool_runs_for_log=tool_runs,
-                            deep_think_runs_for_log=deep_think_runs,
-                        )
-                except Exception:
-                    logger.warning(
-                        "[%s] Chat stream history/observability skipped: db unavailable, session=%s",
-                        trace_id,
+                chat_log = ObservabilityLog(
+                    trace_id=trace_id,
+                    session_id=session_id,
+                    question=payload.question,
+                    model_id=payload.modelId,
+                    latency_ms=elapsed_ms(),
+                    prompt_tokens=usage_stats.prompt_tokens,
+                    completion_tokens=usage_stats.completion_tokens,
+                    total_tokens=usage_stats.total_tokens,
+                    status="success",
+                    error_message=None,
+                    references=[],
+                    skill_calls=skill_calls,
+                    tool_runs=tool_runs,
+                    deep_think_runs=deep_think_runs,
+                )
+
+                async def persist_chat_turn(conn: asyncpg.Connection) -> None:
+                    await _persist_chat_turn(
+                        conn,
                         session_id,
+                        payload.modelId,
+                        use_rag,
+                        title,
+                        [
+                            ("user", payload.question, []),
+                            ("assistant", full_answer, references),
+                        ],
                     )
+                    await _write_observability_logs(conn, chat_log)
+
+                # 历史和日志交给落库 Worker，done 之后流立即结束
+                _schedule_persist(trace_id, persist_chat_turn)
+                log_written = True
 
         except RAGExecutionError as exc:
             logger.exception("[%s] Chat stream execution failed: %s", trace_id, exc)
             if not log_written:
-                try:
-                    async with db_conn_context() as log_conn:
-                        merged_error_calls = [*orchestration_skill_calls, *exc.skill_calls]
-                        await persist_observability_logs(
-                            log_conn,
-                            session_id_for_log=exc.session_id,
-                            model_id_for_log=exc.model_id,
-                            prompt_tokens=exc.prompt_tokens,
-                            completion_tokens=exc.completion_tokens,
-                            total_tokens=exc.total_tokens,
-                            status="failed",
-                            error_message=str(exc),
-                            references_for_log=[],
-                            skill_calls_for_log=merged_error_calls,
-                            tool_runs_for_log=tool_runs,
-                            deep_think_runs_for_log=deep_think_runs,
-                        )
-                except Exception:
-                    logger.warning(
-                        "[%s] Chat stream failed log skipped: db unavailable, session=%s",
-                        trace_id,
-                        exc.session_id,
+                _schedule_observability_logs(
+                    ObservabilityLog(
+                        trace_id=trace_id,
+                        session_id=exc.session_id,
+                        question=payload.question,
+                        model_id=exc.model_id,
+                        latency_ms=elapsed_ms(),
+                        prompt_tokens=exc.prompt_tokens,
+                        completion_tokens=exc.completion_tokens,
+                        total_tokens=exc.total_tokens,
+                        status="failed",
+                        error_message=str(exc),
+                        references=[],
+                        skill_calls=[*orchestration_skill_calls, *exc.skill_calls],
+                        tool_runs=tool_runs,
+                        deep_think_runs=deep_think_runs,
                     )
+                )
             yield _sse_event(
                 "error",
                 {
-                    "message": "问答服务暂时不可用，请稍后重试",
+                    "message": _CHAT_UNAVAILABLE_MESSAGE,
                     "traceId": trace_id,
                     "code": 500,
                 },
@@ -974,36 +1072,32 @@ async def ask_question_stream(
                                 skill_name="mcp.llm.generate",
                                 status="failed",
                                 latency_ms=error_latency_ms,
-                                prompt_tokens=usage_stats["prompt_tokens"],
-                                completion_tokens=usage_stats["completion_tokens"],
-                                total_tokens=usage_stats["total_tokens"],
-                                input_summary=f"model={payload.modelId},mode=chat-only",
+                                prompt_tokens=usage_stats.prompt_tokens,
+                                completion_tokens=usage_stats.completion_tokens,
+                                total_tokens=usage_stats.total_tokens,
+                                input_summary=chat_only_summary,
                                 output_summary="",
                                 error_message=str(exc.detail),
                             )
                         ]
-                try:
-                    async with db_conn_context() as log_conn:
-                        await persist_observability_logs(
-                            log_conn,
-                            session_id_for_log=session_id,
-                            model_id_for_log=model_id,
-                            prompt_tokens=usage_stats["prompt_tokens"],
-                            completion_tokens=usage_stats["completion_tokens"],
-                            total_tokens=usage_stats["total_tokens"],
-                            status="failed",
-                            error_message=str(exc.detail),
-                            references_for_log=[],
-                            skill_calls_for_log=error_skill_calls,
-                            tool_runs_for_log=tool_runs,
-                            deep_think_runs_for_log=deep_think_runs,
-                        )
-                except Exception:
-                    logger.warning(
-                        "[%s] Chat stream failed log skipped: db unavailable, session=%s",
-                        trace_id,
-                        session_id,
+                _schedule_observability_logs(
+                    ObservabilityLog(
+                        trace_id=trace_id,
+                        session_id=session_id,
+                        question=payload.question,
+                        model_id=model_id,
+                        latency_ms=elapsed_ms(),
+                        prompt_tokens=usage_stats.prompt_tokens,
+                        completion_tokens=usage_stats.completion_tokens,
+                        total_tokens=usage_stats.total_tokens,
+                        status="failed",
+                        error_message=str(exc.detail),
+                        references=[],
+                        skill_calls=error_skill_calls,
+                        tool_runs=tool_runs,
+                        deep_think_runs=deep_think_runs,
                     )
+                )
             yield _sse_event(
                 "error",
                 {
@@ -1028,40 +1122,36 @@ async def ask_question_stream(
                                 skill_name="mcp.llm.generate",
                                 status="failed",
                                 latency_ms=error_latency_ms,
-                                prompt_tokens=usage_stats["prompt_tokens"],
-                                completion_tokens=usage_stats["completion_tokens"],
-                                total_tokens=usage_stats["total_tokens"],
-                                input_summary=f"model={payload.modelId},mode=chat-only",
+                                prompt_tokens=usage_stats.prompt_tokens,
+                                completion_tokens=usage_stats.completion_tokens,
+                                total_tokens=usage_stats.total_tokens,
+                                input_summary=chat_only_summary,
                                 output_summary="",
                                 error_message=str(exc),
                             )
                         ]
-                try:
-                    async with db_conn_context() as log_conn:
-                        await persist_observability_logs(
-                            log_conn,
-                            session_id_for_log=session_id,
-                            model_id_for_log=model_id,
-                            prompt_tokens=usage_stats["prompt_tokens"],
-                            completion_tokens=usage_stats["completion_tokens"],
-                            total_tokens=usage_stats["total_tokens"],
-                            status="failed",
-                            error_message=str(exc),
-                            references_for_log=[],
-                            skill_calls_for_log=error_skill_calls,
-                            tool_runs_for_log=tool_runs,
-                            deep_think_runs_for_log=deep_think_runs,
-                        )
-                except Exception:
-                    logger.warning(
-                        "[%s] Chat stream failed log skipped: db unavailable, session=%s",
-                        trace_id,
-                        session_id,
+                _schedule_observability_logs(
+                    ObservabilityLog(
+                        trace_id=trace_id,
+                        session_id=session_id,
+                        question=payload.question,
+                        model_id=model_id,
+                        latency_ms=elapsed_ms(),
+                        prompt_tokens=usage_stats.prompt_tokens,
+                        completion_tokens=usage_stats.completion_tokens,
+                        total_tokens=usage_stats.total_tokens,
+                        status="failed",
+                        error_message=str(exc),
+                        references=[],
+                        skill_calls=error_skill_calls,
+                        tool_runs=tool_runs,
+                        deep_think_runs=deep_think_runs,
                     )
+                )
             yield _sse_event(
                 "error",
                 {
-                    "message": "问答服务暂时不可用，请稍后重试",
+                    "message": _CHAT_UNAVAILABLE_MESSAGE,
                     "traceId": trace_id,
                     "code": 500,
                 },
@@ -1070,45 +1160,101 @@ async def ask_question_stream(
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
+        headers=_SSE_HEADERS,
     )
 
 
 # ============== 聊天历史接口 ==============
 
-@router.get("/sessions")
+# 会话列表与总数一次往返：总数 CTE 恒有一行，LEFT JOIN 当前页，页为空时也能拿到总数。
+# 总数默认读 pg_class.reltuples 估算值，不扫全表；
+# 表还小（估算值低于阈值，含从未 ANALYZE 的 -1）或显式要求精确值时才 COUNT(*)，
+# CASE 里的子查询只在命中该分支时执行。不用 COUNT(*) OVER()，它同样要扫全表。
+# 排序键 (updated_at DESC, session_id DESC) 与 idx_chat_sessions_updated_at 一致，
+# 游标翻页直接从索引定位，不再像 OFFSET 那样先读再丢前面的行
+_LIST_SESSIONS_SQL_TEMPLATE = """
+WITH total AS (
+    SELECT CASE
+        WHEN $2 OR reltuples < $3 THEN (SELECT COUNT(*) FROM chat_sessions)
+        ELSE reltuples::bigint
+    END AS total
+    FROM pg_class
+    WHERE oid = 'chat_sessions'::regclass
+),
+page AS (
+    SELECT
+        session_id,
+        model_id,
+        title,
+        use_rag,
+        created_at,
+        updated_at
+    FROM chat_sessions
+    {page_filter}
+    ORDER BY updated_at DESC, session_id DESC
+    LIMIT $1 {page_offset}
+)
+SELECT total.total, page.*
+FROM total
+LEFT JOIN page ON TRUE
+ORDER BY page.updated_at DESC, page.session_id DESC
+"""
+# 两种翻页方式各一条固定 SQL，保证 asyncpg 按文本命中预编译缓存
+_LIST_SESSIONS_BY_OFFSET_SQL = _LIST_SESSIONS_SQL_TEMPLATE.format(
+    page_filter="",
+    page_offset="OFFSET $4",
+)
+_LIST_SESSIONS_BY_CURSOR_SQL = _LIST_SESSIONS_SQL_TEMPLATE.format(
+    page_filter="WHERE (updated_at, session_id) < ($4, $5)",
+    page_offset="",
+)
+_EXACT_COUNT_THRESHOLD = 10000
+
+
+def _encode_session_cursor(updated_at: datetime, session_id: str) -> str:
+    raw = f"{updated_at.isoformat()}|{session_id}".encode()
+    return urlsafe_b64encode(raw).decode()
+
+
+def _decode_session_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        updated_at, session_id = urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(updated_at), session_id
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="cursor 无效") from exc
+
+
 async def list_sessions(
     request: Request,
     limit: int = 20,
     offset: int = 0,
+    cursor: str | None = None,
+    exact: bool = False,
     conn=Depends(get_db_conn),
-) -> dict[str, object]:
-    """获取聊天会话列表"""
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
-
-    rows = await conn.fetch(
-        """
-        SELECT
-            session_id,
-            model_id,
-            title,
-            use_rag,
-            created_at,
-            updated_at
-        FROM chat_sessions
-        ORDER BY updated_at DESC
-        LIMIT $1 OFFSET $2
-        """,
-        limit,
-        offset,
-    )
-
-    count_row = await conn.fetchrow("SELECT COUNT(*) AS total FROM chat_sessions")
-    total = count_row["total"] if count_row else 0
+) -> ORJSONResponse:
+    """
+    获取聊天会话列表
+
+    说明：
+    - total 在大表上是估算值；需要精确总数（比如管理端对账）时传 exact=true。
+    - 翻页优先用 cursor（上一页返回的 nextCursor）；offset 仅为兼容旧调用保留，页数深了会越来越慢。
+    """
+    trace_id = get_trace_id(request)
+
+    if cursor:
+        cursor_updated_at, cursor_session_id = _decode_session_cursor(cursor)
+        rows = await conn.fetch(
+            _LIST_SESSIONS_BY_CURSOR_SQL,
+            limit,
+            exact,
+            _EXACT_COUNT_THRESHOLD,
+            cursor_updated_at,
+            cursor_session_id,
+        )
+    else:
+        rows = await conn.fetch(_LIST_SESSIONS_BY_OFFSET_SQL, limit, exact, _EXACT_COUNT_THRESHOLD, offset)
+    total = (rows[0]["total"] or 0) if rows else 0
+    page_rows = [row for row in rows if row["session_id"] is not None]
 
     items = [
         {
@@ -1119,73 +1265,157 @@ async def list_sessions(
             "createdAt": row["created_at"].isoformat() if row["created_at"] else None,
             "updatedAt": row["updated_at"].isoformat() if row["updated_at"] else None,
         }
-        for row in rows
+        for row in page_rows
     ]
+    next_cursor = (
+        _encode_session_cursor(page_rows[-1]["updated_at"], page_rows[-1]["session_id"])
+        if len(page_rows) == limit
+        else None
+    )
+
+    return success_response({"items": items, "total": total, "nextCursor": next_cursor}, trace_id)
+
+
+_SESSION_MESSAGES_SQL = """
+SELECT
+    id,
+    role,
+    content,
+    "references",
+    created_at
+FROM chat_messages
+WHERE session_id = $1
+ORDER BY created_at ASC, id ASC
+"""
+
+
+# 非流式：整段消息在库里聚合成一个 jsonb 数组，经连接上的 jsonb 编解码器一次解出，
+# Python 侧不再逐行取 Record 字段、逐行 isoformat；
+# 时间统一按 UTC 输出，与 datetime.isoformat() 的 +00:00 格式一致。
+# 外层从 chat_sessions 取：会话不存在时一行都不返回，存在性检查和取消息合成一次往返
+_SESSION_MESSAGES_JSON_SQL = """
+SELECT (
+    SELECT COALESCE(
+        jsonb_agg(
+            jsonb_build_object(
+                'id', m.id,
+                'role', m.role,
+                'content', m.content,
+                'references', COALESCE(m."references", '[]'::jsonb),
+                'createdAt', to_char(m.created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"')
+            )
+            ORDER BY m.created_at ASC, m.id ASC
+        ),
+        '[]'::jsonb
+    )
+    FROM chat_messages m
+    WHERE m.session_id = s.session_id
+) AS messages
+FROM chat_sessions s
+WHERE s.session_id = $1
+"""
+
+_SESSION_EXISTS_SQL = "SELECT 1 FROM chat_sessions WHERE session_id = $1"
+
+
+def _message_row_to_dict(row: asyncpg.Record) -> dict[str, object]:
+    return {
+        "id": row["id"],
+        "role": row["role"],
+        "content": row["content"],
+        # 连接上已注册 jsonb 解码，读出即为 list；只有历史空值需要兜底
+        "references": row["references"] or [],
+        "createdAt": row["created_at"].isoformat() if row["created_at"] else None,
+    }
+
 
-    return success({"items": items, "total": total}, trace_id)
+async def _stream_session_messages(session_id: str, trace_id: str) -> AsyncIterator[bytes]:
+    """
+    逐行下发消息（NDJSON），游标分批从库里取，不在内存里攒整段会话
+
+    说明：
+    - 依赖注入的连接在响应开始发送前就已归还，这里自己取连接；游标必须在事务里使用。
+    - 响应头已发出后出错无法再改状态码，只记日志并结束流。
+    """
+    try:
+        async with db_conn_context() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(_SESSION_MESSAGES_SQL, session_id):
+                    yield orjson.dumps(_message_row_to_dict(row)) + b"\n"
+    except Exception:
+        logger.exception("[%s] Session messages stream aborted, session=%s", trace_id, session_id)
 
 
-@router.get("/sessions/{session_id}/messages")
 async def get_session_messages(
     session_id: str,
     request: Request,
+    stream: bool = False,
     conn=Depends(get_db_conn),
-) -> dict[str, object]:
-    """获取会话的消息历史"""
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+) -> Response:
+    """
+    获取会话的消息历史
+
+    说明：
+    - 默认返回完整列表；长会话可传 stream=true，按 NDJSON 每行一条消息流式下发。
+    """
+    trace_id = get_trace_id(request)
+
+    if stream:
+        # 流式下发前先确认会话存在，响应头一旦发出就没法再回 404
+        if await conn.fetchval(_SESSION_EXISTS_SQL, session_id) is None:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        return StreamingResponse(
+            _stream_session_messages(session_id, trace_id),
+            media_type="application/x-ndjson",
+        )
 
-    # 检查会话是否存在
-    session_row = await conn.fetchrow(
-        "SELECT session_id FROM chat_sessions WHERE session_id = $1",
-        session_id,
-    )
-    if not session_row:
+    row = await conn.fetchrow(_SESSION_MESSAGES_JSON_SQL, session_id)
+    if row is None:
         raise HTTPException(status_code=404, detail="会话不存在")
 
-    rows = await conn.fetch(
-        """
-        SELECT
-            id,
-            role,
-            content,
-            "references",
-            created_at
-        FROM chat_messages
-        WHERE session_id = $1
-        ORDER BY created_at ASC
-        """,
-        session_id,
-    )
+    return success_response({"sessionId": session_id, "messages": row["messages"]}, trace_id)
 
-    messages = [
-        {
-            "id": row["id"],
-            "role": row["role"],
-            "content": row["content"],
-            "references": _parse_references(row["references"]),
-            "createdAt": row["created_at"].isoformat() if row["created_at"] else None,
-        }
-        for row in rows
-    ]
 
-    return success({"sessionId": session_id, "messages": messages}, trace_id)
+# 消息表外键带 ON DELETE CASCADE，删会话即连带删消息；RETURNING 直接告诉我们有没有删到
+_DELETE_SESSION_SQL = "DELETE FROM chat_sessions WHERE session_id = $1 RETURNING 1"
 
 
-@router.delete("/sessions/{session_id}")
 async def delete_session(
     session_id: str,
     request: Request,
     conn=Depends(get_db_conn),
-) -> dict[str, object]:
+) -> ORJSONResponse:
     """删除会话及其消息"""
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
 
-    result = await conn.execute(
-        "DELETE FROM chat_sessions WHERE session_id = $1",
-        session_id,
-    )
-    deleted = int(result.split()[-1]) if result else 0
-    if deleted == 0:
+    deleted = await conn.fetchval(_DELETE_SESSION_SQL, session_id)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="会话不存在")
 
-    return success({"deleted": True, "sessionId": session_id}, trace_id)
+    return success_response({"deleted": True, "sessionId": session_id}, trace_id)
+
+
+# ============== 路由表 ==============
+# 启动时按表一次性注册，所有路径集中在一处，便于静态查看
+
+_API_ROUTES = (
+    ("POST", "/ask-stream", ask_question_stream),
+    ("GET", "/sessions", list_sessions),
+    ("GET", "/sessions/{session_id}/messages", get_session_messages),
+    ("DELETE", "/sessions/{session_id}", delete_session),
+)
+
+# 原生 Starlette 路由：不走依赖注入，由上层 api_router 拼完整前缀后注册
+RAW_ROUTES = (("POST", "/ask", ask_question),)
+
+# 生产环境不对外暴露 /docs，聊天路由不再生成 OpenAPI 片段；响应模型统一显式关闭
+_INCLUDE_IN_SCHEMA = settings.app_env != "prod"
+
+for _method, _path, _endpoint in _API_ROUTES:
+    router.add_api_route(
+        _path,
+        _endpoint,
+        methods=[_method],
+        response_model=None,
+        include_in_schema=_INCLUDE_IN_SCHEMA,
+    )
@@ -1,9 +1,14 @@
-import json
+import asyncio
 import logging
 import mimetypes
+import os
 import re
+import shutil
+import stat
+from contextvars import ContextVar
+from functools import lru_cache
 from pathlib import Path as FsPath
-from typing import Any
+from typing import Any, BinaryIO
 from urllib.parse import quote
 from uuid import uuid4
 
@@ -15,7 +20,7 @@ from app.core.config import get_settings
 from app.core.database import get_db_conn
 from app.core.rabbitmq import get_rabbitmq_client
 from app.core.redis_client import get_redis_client
-from app.core.response import success
+from app.core.response import get_trace_id, success
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 settings = get_settings()
@@ -56,63 +61,74 @@ CHAPTER_HEADING_PATTERN = re.compile(
 )
 NUMBERED_HEADING_PATTERN = re.compile(r"^(\d+(?:\.\d+){0,4})[\s、.．:：\)]*(.+)$")
 PAGE_NO_PATTERN = re.compile(r"第\s*(\d+)\s*页|page\s*(\d+)", flags=re.IGNORECASE)
+HEADING_TEXT_PATTERN = re.compile(r"[A-Za-z\u4e00-\u9fff]")
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[。！？!?；;])\s*")
+PARAGRAPH_SPLIT_PATTERN = re.compile(r"\n{2,}")
+UNSAFE_FILE_NAME_PATTERN = re.compile(r"[^a-zA-Z0-9._-]+")
 
 
 def _parse_metadata(value: Any) -> dict[str, Any]:
-    if isinstance(value, dict):
-        return value
-    if isinstance(value, str):
-        try:
-            parsed = json.loads(value)
-            if isinstance(parsed, dict):
-                return parsed
-        except Exception:
-            return {}
-    return {}
+    # 连接上已注册 jsonb 解码（见 DatabasePool._init_connection），读出即为 dict，不再二次解析
+    return value if isinstance(value, dict) else {}
 
 
 def _sanitize_file_name(file_name: str) -> str:
     raw = FsPath(file_name).name.strip() or "unnamed"
-    safe = re.sub(r"[^a-zA-Z0-9._-]+", "_", raw)
+    safe = UNSAFE_FILE_NAME_PATTERN.sub("_", raw)
     return safe[:180] or "unnamed"
 
 
-async def _save_upload_file(file: UploadFile, document_id: str, file_name: str) -> str:
-    uploads_dir = settings.documents_upload_path
-    uploads_dir.mkdir(parents=True, exist_ok=True)
-    safe_name = _sanitize_file_name(file_name)
-    target_path = uploads_dir / f"{document_id}-{safe_name}"
+UPLOAD_COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
 
+def _copy_upload_file(source: BinaryIO, target_path: FsPath) -> int:
+    """按固定大小的块拷贝到目标文件，返回写入的字节数（即文件大小）"""
+    source.seek(0)
     with target_path.open("wb") as output:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:
-                break
-            output.write(chunk)
+        shutil.copyfileobj(source, output, UPLOAD_COPY_BUFFER_SIZE)
+        written = output.tell()
+    source.seek(0)
+    return written
+
+
+@lru_cache
+def _uploads_root() -> FsPath:
+    """上传目录：解析路径和建目录只在首次用到时做一次，进程内配置不会变"""
+    root = settings.documents_upload_path.expanduser().resolve()
+    root.mkdir(parents=True, exist_ok=True)
+    return root
 
-    try:
-        file.file.seek(0)
-    except Exception:
-        pass
-    return str(target_path)
 
+async def _save_upload_file(file: UploadFile, document_id: str, file_name: str) -> tuple[str, int]:
+    uploads_dir = _uploads_root()
+    safe_name = _sanitize_file_name(file_name)
+    target_path = uploads_dir / f"{document_id}-{safe_name}"
+
+    # 上传内容已在临时文件里，分块拷贝丢到线程池，磁盘写不再阻塞事件循环；
+    # 文件大小顺带从拷贝结果拿，不再单独 seek 到末尾量一次
+    file_size = await asyncio.to_thread(_copy_upload_file, file.file, target_path)
+    return str(target_path), file_size
 
-def _save_text_file(document_id: str, file_name: str, content: str) -> str:
-    uploads_dir = settings.documents_upload_path
-    uploads_dir.mkdir(parents=True, exist_ok=True)
+
+def _save_bytes_file(document_id: str, file_name: str, data: bytes) -> str:
+    uploads_dir = _uploads_root()
     safe_name = _sanitize_file_name(file_name)
     target_path = uploads_dir / f"{document_id}-{safe_name}"
-    target_path.write_text(content, encoding="utf-8")
+    target_path.write_bytes(data)
     return str(target_path)
 
 
 def _to_document_item(row: Any) -> dict[str, Any]:
     metadata = _parse_metadata(row["metadata"])
     file_size_value = metadata.get("fileSizeBytes")
-    try:
-        file_size = int(file_size_value) if file_size_value is not None else 0
-    except Exception:
-        file_size = 0
+    # 上传/导入写进去的就是 int，常见情况直接用，只有老数据里的字符串等才走 int() 兜底
+    if isinstance(file_size_value, int):
+        file_size = file_size_value
+    else:
+        try:
+            file_size = int(file_size_value) if file_size_value is not None else 0
+        except Exception:
+            file_size = 0
 
     return {
         "documentId": str(row["document_id"]),
@@ -142,37 +158,50 @@ def _normalize_strategy(strategy: str) -> str:
     return mapped
 
 
+# 一次切分内的规范化结果缓存：各策略会对同一段文本（整篇、段落、父块）反复规范化，
+# 由 _split_text 在入口建好、出口清掉，缓存不会跨请求常驻
+_normalize_cache: ContextVar[dict[str, str] | None] = ContextVar("_normalize_cache", default=None)
+
+
+def _collapse_whitespace(text: str) -> str:
+    # 与 re.sub(r"\s+", " ", text).strip() 逐字符等价（两者都按 str.isspace 判定空白），
+    # 但 split/join 全程在 C 里完成，比正则替换快数倍
+    return " ".join(text.split())
+
+
 def _normalize_text(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
+    cache = _normalize_cache.get()
+    if cache is None:
+        return _collapse_whitespace(text)
+    normalized = cache.get(text)
+    if normalized is None:
+        normalized = _collapse_whitespace(text)
+        cache[text] = normalized
+        # 规范化是幂等的：结果本身再被规范化时直接命中
+        cache[normalized] = normalized
+    return normalized
 
 
 def _split_text_fixed(text: str, chunk_size: int, overlap: int) -> list[dict[str, object]]:
-    clean = re.sub(r"\s+", " ", text).strip()
+    clean = _normalize_text(text)
     if not clean:
         return []
 
-    chunks: list[dict[str, object]] = []
-    start = 0
-    idx = 1
+    text_length = len(clean)
     safe_overlap = min(overlap, max(chunk_size - 1, 0))
     step = max(chunk_size - safe_overlap, 1)
 
-    while start < len(clean):
-        end = min(start + chunk_size, len(clean))
-        content = clean[start:end]
-        chunks.append(
-            {
-                "chunkId": f"preview-{idx}",
-                "start": start,
-                "end": end,
-                "length": len(content),
-                "content": content,
-            }
-        )
-        idx += 1
-        start += step
-
-    return chunks
+    # 起点序列由 range 直接给出，循环体只剩切片和建 dict
+    return [
+        {
+            "chunkId": f"preview-{idx}",
+            "start": start,
+            "end": (end := min(start + chunk_size, text_length)),
+            "length": end - start,
+            "content": clean[start:end],
+        }
+        for idx, start in enumerate(range(0, text_length, step), start=1)
+    ]
 
 
 def _split_long_unit(unit: str, chunk_size: int) -> list[str]:
@@ -182,30 +211,39 @@ def _split_long_unit(unit: str, chunk_size: int) -> list[str]:
 
 
 def _merge_units(units: list[str], chunk_size: int) -> list[str]:
+    # 只累加长度判断能不能并入，一组定下来才 join 一次，不再每并一个单元就拼出一份新字符串
     merged: list[str] = []
-    current = ""
+    buffer: list[str] = []
+    buffer_length = 0
     for unit in units:
-        if not current:
-            current = unit
+        if not buffer_length:
+            buffer = [unit]
+            buffer_length = len(unit)
             continue
-        candidate = f"{current} {unit}"
-        if len(candidate) <= chunk_size:
-            current = candidate
+        candidate_length = buffer_length + 1 + len(unit)
+        if candidate_length <= chunk_size:
+            buffer.append(unit)
+            buffer_length = candidate_length
         else:
-            merged.append(current)
-            current = unit
-    if current:
-        merged.append(current)
+            merged.append(" ".join(buffer))
+            buffer = [unit]
+            buffer_length = len(unit)
+    if buffer_length:
+        merged.append(" ".join(buffer))
     return merged
 
 
 def _split_text_sentence(text: str, chunk_size: int) -> list[str]:
-    clean = _normalize_text(text)
+    return _split_clean_sentences(_normalize_text(text), chunk_size)
+
+
+def _split_clean_sentences(clean: str, chunk_size: int) -> list[str]:
+    """对已规范化的文本按句切分，调用方保证不必再规范化一遍"""
     if not clean:
         return []
     units = [
         sentence.strip()
-        for sentence in re.split(r"(?<=[。！？!?；;])\s*", clean)
+        for sentence in SENTENCE_SPLIT_PATTERN.split(clean)
         if sentence.strip()
     ]
     if not units:
@@ -222,7 +260,7 @@ def _split_text_paragraph(text: str, chunk_size: int) -> list[str]:
         return []
     units = [
         _normalize_text(paragraph)
-        for paragraph in re.split(r"\n{2,}", raw)
+        for paragraph in PARAGRAPH_SPLIT_PATTERN.split(raw)
         if _normalize_text(paragraph)
     ]
     if len(units) <= 1:
@@ -254,23 +292,29 @@ def _detect_heading(line: str) -> tuple[int, str] | None:
     if not stripped:
         return None
 
-    markdown_match = MARKDOWN_HEADING_PATTERN.match(stripped)
-    if markdown_match:
+    # 三种标题的首字符互斥（#、第、数字），先按首字符分流，正文行一条正则都不用跑
+    first_char = stripped[0]
+    if first_char == "#":
+        markdown_match = MARKDOWN_HEADING_PATTERN.match(stripped)
+        if not markdown_match:
+            return None
         level = min(max(len(markdown_match.group(1)), 1), 4)
         title = _normalize_text(markdown_match.group(2))
         return (level, title) if title else None
 
-    chapter_match = CHAPTER_HEADING_PATTERN.match(stripped)
-    if chapter_match:
-        return (1, _normalize_text(stripped))
+    if first_char == "第":
+        if CHAPTER_HEADING_PATTERN.match(stripped):
+            return (1, _normalize_text(stripped))
+        return None
 
-    numbered_match = NUMBERED_HEADING_PATTERN.match(stripped)
+    # str.isdecimal 与正则 \d 判定的字符集一致
+    numbered_match = NUMBERED_HEADING_PATTERN.match(stripped) if first_char.isdecimal() else None
     if numbered_match:
         number = numbered_match.group(1)
         title_text = _normalize_text(numbered_match.group(2))
         if not title_text:
             return None
-        if not re.search(r"[A-Za-z\u4e00-\u9fff]", title_text):
+        if not HEADING_TEXT_PATTERN.search(title_text):
             return None
         level = min(number.count(".") + 1, 4)
         return (level, f"{number} {title_text}")
@@ -288,6 +332,9 @@ def _build_pageindex_sections(text: str) -> list[dict[str, Any]]:
     level_counters = [0, 0, 0, 0]
     heading_stack: list[str] = []
     last_seen_page = 1
+    # 已处理部分规范化（_normalize_text）后的长度：行之间的换行在规范化后至多是一个空格，
+    # 逐行累加就能知道每个小节正文在整篇规范化文本里的起点，不必事后再 find 回去
+    normalized_length = 0
 
     current: dict[str, Any] = {
         "title": "文档正文",
@@ -296,11 +343,13 @@ def _build_pageindex_sections(text: str) -> list[dict[str, Any]]:
         "nodePath": "文档正文",
         "pageStart": None,
         "pageEnd": None,
+        "charStart": 0,
         "contentLines": [],
     }
 
     def flush_current() -> None:
-        content = _normalize_text("\n".join(current["contentLines"]))
+        # contentLines 里存的已是逐行规范化后的非空行，空格拼一次就是整段规范化结果，不再整段重扫
+        content = " ".join(current["contentLines"])
         if not content:
             return
         sections.append(
@@ -311,12 +360,17 @@ def _build_pageindex_sections(text: str) -> list[dict[str, Any]]:
                 "nodePath": current["nodePath"],
                 "pageStart": current["pageStart"],
                 "pageEnd": current["pageEnd"],
+                "charStart": current["charStart"],
                 "content": content,
             }
         )
 
     for line in lines:
         stripped = line.strip()
+        line_start = normalized_length + 1 if normalized_length and stripped else normalized_length
+        normalized_line = _normalize_text(stripped) if stripped else ""
+        if normalized_line:
+            normalized_length = line_start + len(normalized_line)
         page_no = _extract_page_no(stripped)
         if page_no is not None:
             last_seen_page = page_no
@@ -349,12 +403,15 @@ def _build_pageindex_sections(text: str) -> list[dict[str, Any]]:
                 "nodePath": " > ".join(heading_stack),
                 "pageStart": page_no if page_no is not None else last_seen_page,
                 "pageEnd": page_no if page_no is not None else last_seen_page,
+                "charStart": 0,
                 "contentLines": [],
             }
             continue
 
-        if stripped or current["contentLines"]:
-            current["contentLines"].append(line)
+        if normalized_line:
+            if not current["contentLines"]:
+                current["charStart"] = line_start
+            current["contentLines"].append(normalized_line)
 
     flush_current()
 
@@ -392,20 +449,22 @@ def _split_text_pageindex(
 
     chunks: list[dict[str, object]] = []
     chunk_index = 1
-    search_cursor = 0
+    clean_length = len(clean)
 
     for section in sections:
-        section_content = str(section.get("content", "")).strip()
+        section_content = section["content"]
         if not section_content:
             continue
 
-        section_start = clean.find(section_content, search_cursor)
-        if section_start < 0:
-            section_start = clean.find(section_content)
-        if section_start < 0:
-            section_start = search_cursor
-        section_end = min(section_start + len(section_content), len(clean))
-        search_cursor = section_end
+        # 小节起点在切小节时已按规范化偏移记好，直接用，不再在全文里 find
+        section_start = section["charStart"]
+        # 小节字段类型由 _build_pageindex_sections 保证（页码已回填成 int），每个小节取一次，块循环里直接用
+        section_title = section["title"] or "文档正文"
+        node_path = section["nodePath"] or section_title
+        node_id = section["nodeId"]
+        level = section["level"]
+        page_start = section["pageStart"]
+        page_end = section["pageEnd"]
 
         section_units = _split_text_paragraph(section_content, chunk_size)
         if not section_units:
@@ -415,20 +474,12 @@ def _split_text_pageindex(
 
         section_chunks = _build_chunks_from_units(section_content, section_units, overlap)
         for section_chunk in section_chunks:
-            local_start = int(section_chunk["start"])
-            local_end = int(section_chunk["end"])
-            global_start = min(section_start + local_start, len(clean))
-            global_end = min(section_start + local_end, len(clean))
+            global_start = min(section_start + section_chunk["start"], clean_length)
+            global_end = min(section_start + section_chunk["end"], clean_length)
             content = clean[global_start:global_end]
             if not content:
                 continue
 
-            page_start = section.get("pageStart")
-            page_end = section.get("pageEnd")
-            level = section.get("level")
-            section_title = str(section.get("title") or "文档正文")
-            node_path = str(section.get("nodePath") or section_title)
-
             chunks.append(
                 {
                     "chunkId": f"preview-{chunk_index}",
@@ -436,11 +487,11 @@ def _split_text_pageindex(
                     "end": global_end,
                     "length": len(content),
                     "content": content,
-                    "nodeId": str(section.get("nodeId") or f"node-{chunk_index}"),
+                    "nodeId": node_id,
                     "nodePath": node_path,
-                    "level": int(level) if isinstance(level, int) else 1,
-                    "pageStart": int(page_start) if isinstance(page_start, int) else 1,
-                    "pageEnd": int(page_end) if isinstance(page_end, int) else 1,
+                    "level": level,
+                    "pageStart": page_start,
+                    "pageEnd": page_end,
                     "charStart": global_start,
                     "charEnd": global_end,
                     "sectionTitle": section_title,
@@ -466,7 +517,7 @@ def _split_text_parent_child(
     if not parent_units:
         parent_units = _split_text_sentence(text, parent_chunk_size)
 
-    parent_chunks = _build_chunks_from_units(clean, parent_units, overlap=0)
+    parent_chunks = _build_chunks_from_clean(clean, parent_units, overlap=0)
     if not parent_chunks:
         return []
 
@@ -479,10 +530,11 @@ def _split_text_parent_child(
         parent_content = clean[parent_start:parent_end]
         parent_chunk_id = f"parent-{parent_index}"
 
-        child_units = _split_text_sentence(parent_content, chunk_size)
+        # 父块是 clean 的切片，本身已规范化，子块切分直接在上面做
+        child_units = _split_clean_sentences(parent_content, chunk_size)
         if not child_units:
             child_units = _split_long_unit(parent_content, chunk_size)
-        local_children = _build_chunks_from_units(parent_content, child_units, overlap)
+        local_children = _build_chunks_from_clean(parent_content, child_units, overlap)
 
         for child in local_children:
             local_start = int(child["start"])
@@ -508,12 +560,42 @@ def _split_text_parent_child(
     return child_chunks
 
 
+def _locate_unit(clean: str, unit: str, cursor: int) -> tuple[int, int] | None:
+    """
+    从 cursor 起顺着原文比对切分单元，返回它在 clean 中的 (start, end)
+
+    说明：
+    - 单元按原文顺序产出，只会比原文多出 _merge_units 拼接时补的单个空格（句子之间原文可能没有空白），
+      所以按空格拆段后逐段 startswith，段与段之间允许原文有 0~n 个空白，不做子串搜索。
+    - 对不上时返回 None，由调用方落在游标处，不再退回全文 find（对不上时 find 会扫到文末，长文档上是 O(N²)）。
+    """
+    text_length = len(clean)
+    position = cursor
+    start = -1
+    for part in unit.split(" "):
+        while position < text_length and clean[position].isspace():
+            position += 1
+        if start < 0:
+            start = position
+        if not clean.startswith(part, position):
+            return None
+        position += len(part)
+    return start, position
+
+
 def _build_chunks_from_units(
     text: str,
     chunk_units: list[str],
     overlap: int,
 ) -> list[dict[str, object]]:
-    clean = _normalize_text(text)
+    return _build_chunks_from_clean(_normalize_text(text), chunk_units, overlap)
+
+
+def _build_chunks_from_clean(
+    clean: str,
+    chunk_units: list[str],
+    overlap: int,
+) -> list[dict[str, object]]:
     if not clean or not chunk_units:
         return []
 
@@ -522,10 +604,12 @@ def _build_chunks_from_units(
     cursor = 0
 
     for idx, unit in enumerate(chunk_units, start=1):
-        start = clean.find(unit, cursor)
-        if start < 0:
+        located = _locate_unit(clean, unit, cursor)
+        if located is None:
             start = cursor
-        end = min(start + len(unit), len(clean))
+            end = min(start + len(unit), len(clean))
+        else:
+            start, end = located
         content_start = max(start - safe_overlap, 0) if idx > 1 else start
         content = clean[content_start:end]
 
@@ -550,6 +634,19 @@ def _split_text(
     strategy: str,
 ) -> list[dict[str, object]]:
     normalized_strategy = _normalize_strategy(strategy)
+    token = _normalize_cache.set({})
+    try:
+        return _split_text_with_strategy(text, chunk_size, overlap, normalized_strategy)
+    finally:
+        _normalize_cache.reset(token)
+
+
+def _split_text_with_strategy(
+    text: str,
+    chunk_size: int,
+    overlap: int,
+    normalized_strategy: str,
+) -> list[dict[str, object]]:
     if normalized_strategy == "fixed":
         return _split_text_fixed(text, chunk_size, overlap)
     if normalized_strategy == "sentence":
@@ -563,6 +660,156 @@ def _split_text(
     return _build_chunks_from_units(text, units, overlap)
 
 
+# 文档接口的 SQL 都收成模块常量：文本固定，asyncpg 按连接的预编译缓存（statement_cache_size）
+# 每条只 parse/plan 一次，后续请求直接复用
+_INSERT_DOCUMENT_SQL = """
+INSERT INTO documents (id, file_name, source, status, metadata)
+VALUES ($1::uuid, $2, $3, $4, $5)
+"""
+
+_DOCUMENT_COLUMNS_SQL = "id::text AS document_id, file_name, source, status, metadata, created_at, updated_at"
+
+_GET_DOCUMENT_SQL = f"""
+SELECT {_DOCUMENT_COLUMNS_SQL}
+FROM documents
+WHERE id::text = $1
+  AND deleted_at IS NULL
+LIMIT 1
+"""
+
+_LIST_DOCUMENTS_SQL_TEMPLATE = """
+SELECT {columns}
+FROM documents
+WHERE deleted_at IS NULL{status_filter}
+ORDER BY created_at DESC
+LIMIT {limit_param}
+"""
+# 要总数时与列表合成一次往返：总数 CTE 恒有一行，LEFT JOIN 当前页，页为空时也能拿到总数
+_LIST_DOCUMENTS_WITH_TOTAL_SQL_TEMPLATE = """
+WITH total AS (
+    SELECT COUNT(1) AS total
+    FROM documents
+    WHERE deleted_at IS NULL{status_filter}
+),
+page AS (
+    SELECT {columns}
+    FROM documents
+    WHERE deleted_at IS NULL{status_filter}
+    ORDER BY created_at DESC
+    LIMIT {limit_param}
+)
+SELECT total.total, page.*
+FROM total
+LEFT JOIN page ON TRUE
+ORDER BY page.created_at DESC
+"""
+# 状态过滤可选：有/无过滤各一条固定 SQL，不用 "$1 IS NULL OR ..." 这种会让通用计划丢掉索引的写法
+_LIST_DOCUMENTS_SQL = _LIST_DOCUMENTS_SQL_TEMPLATE.format(
+    columns=_DOCUMENT_COLUMNS_SQL,
+    status_filter="",
+    limit_param="$1",
+)
+_LIST_DOCUMENTS_BY_STATUS_SQL = _LIST_DOCUMENTS_SQL_TEMPLATE.format(
+    columns=_DOCUMENT_COLUMNS_SQL,
+    status_filter=" AND status = $1",
+    limit_param="$2",
+)
+_LIST_DOCUMENTS_WITH_TOTAL_SQL = _LIST_DOCUMENTS_WITH_TOTAL_SQL_TEMPLATE.format(
+    columns=_DOCUMENT_COLUMNS_SQL,
+    status_filter="",
+    limit_param="$1",
+)
+_LIST_DOCUMENTS_WITH_TOTAL_BY_STATUS_SQL = _LIST_DOCUMENTS_WITH_TOTAL_SQL_TEMPLATE.format(
+    columns=_DOCUMENT_COLUMNS_SQL,
+    status_filter=" AND status = $1",
+    limit_param="$2",
+)
+
+_GET_DOCUMENT_FILE_SQL = """
+SELECT
+    id::text AS document_id,
+    file_name,
+    metadata
+FROM documents
+WHERE id::text = $1
+  AND deleted_at IS NULL
+LIMIT 1
+"""
+
+_GET_TOOL_RUN_SQL = """
+SELECT
+    id,
+    trace_id,
+    tool_name,
+    status,
+    output_payload
+FROM tool_runs
+WHERE id = $1
+LIMIT 1
+"""
+
+_SOFT_DELETE_DOCUMENT_SQL = """
+UPDATE documents
+SET deleted_at = NOW(), updated_at = NOW()
+WHERE id::text = $1 AND deleted_at IS NULL
+RETURNING id::text AS document_id, file_name
+"""
+
+# 分块列表一次往返：文档存在性、分块总数、当前页合成一条 SQL。
+# doc 为空（文档不存在或已删除）时整条无行；总数 CTE 恒有一行，LEFT JOIN 当前页，
+# 页为空（含 offset 越过末尾）时也能拿到总数。不用 COUNT(*) OVER()，页为空时它拿不到总数。
+# 分块元数据在库里直接取字段并转成 int：Worker 写的是驼峰键，蛇形键是老数据兜底；
+# 非整数的脏值按 NULL 返回，不让整页报错。Python 侧只按列名搬值，不再整份解 metadata
+_LIST_DOCUMENT_CHUNKS_SQL = """
+WITH doc AS (
+    SELECT id, id::text AS document_id, file_name, status
+    FROM documents
+    WHERE id::text = $1 AND deleted_at IS NULL
+),
+total AS (
+    SELECT COUNT(1) AS total
+    FROM document_chunks
+    WHERE document_id = (SELECT id FROM doc)
+),
+page AS (
+    SELECT
+        c.id::text AS chunk_id,
+        c.chunk_index,
+        c.content,
+        c.token_count,
+        c.created_at,
+        m.node_id,
+        m.node_path,
+        m.section_title,
+        CASE WHEN m.level ~ '^-?[0-9]{1,9}$' THEN m.level::int END AS level,
+        CASE WHEN m.page_start ~ '^-?[0-9]{1,9}$' THEN m.page_start::int END AS page_start,
+        CASE WHEN m.page_end ~ '^-?[0-9]{1,9}$' THEN m.page_end::int END AS page_end,
+        CASE WHEN m.char_start ~ '^-?[0-9]{1,9}$' THEN m.char_start::int END AS char_start,
+        CASE WHEN m.char_end ~ '^-?[0-9]{1,9}$' THEN m.char_end::int END AS char_end
+    FROM document_chunks c
+    CROSS JOIN LATERAL (
+        SELECT
+            COALESCE(c.metadata->>'nodeId', c.metadata->>'node_id') AS node_id,
+            COALESCE(c.metadata->>'nodePath', c.metadata->>'node_path') AS node_path,
+            COALESCE(c.metadata->>'sectionTitle', c.metadata->>'section_title') AS section_title,
+            c.metadata->>'level' AS level,
+            COALESCE(c.metadata->>'pageStart', c.metadata->>'page_start') AS page_start,
+            COALESCE(c.metadata->>'pageEnd', c.metadata->>'page_end') AS page_end,
+            COALESCE(c.metadata->>'charStart', c.metadata->>'char_start') AS char_start,
+            COALESCE(c.metadata->>'charEnd', c.metadata->>'char_end') AS char_end
+    ) AS m
+    WHERE c.document_id = (SELECT id FROM doc)
+    ORDER BY c.chunk_index ASC
+    LIMIT $2 OFFSET $3
+)
+SELECT doc.document_id, doc.file_name, doc.status, total.total, page.*
+FROM doc
+CROSS JOIN total
+LEFT JOIN page ON TRUE
+ORDER BY page.chunk_index ASC
+"""
+
+
 @router.post("/upload")
 async def upload_document(
     request: Request,
@@ -570,22 +817,14 @@ async def upload_document(
     strategy: str = Form("fixed"),
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     task_id = f"task-{uuid4()}"
     document_id = str(uuid4())
     normalized_strategy = _normalize_strategy(strategy)
     file_name = file.filename or "unnamed"
-    file_size = 0
-    try:
-        file.file.seek(0, 2)
-        file_size = int(file.file.tell())
-        file.file.seek(0)
-    except Exception:
-        file_size = 0
 
-    storage_path = ""
     try:
-        storage_path = await _save_upload_file(file, document_id, file_name)
+        storage_path, file_size = await _save_upload_file(file, document_id, file_name)
     except Exception as exc:
         logger.exception("[%s] Save upload file failed: %s", trace_id, exc)
         raise HTTPException(status_code=500, detail="文件保存失败，请稍后重试") from exc
@@ -599,15 +838,12 @@ async def upload_document(
     }
 
     await conn.execute(
-        """
-        INSERT INTO documents (id, file_name, source, status, metadata)
-        VALUES ($1::uuid, $2, $3, $4, $5::jsonb)
-        """,
+        _INSERT_DOCUMENT_SQL,
         document_id,
         file_name,
         "upload",
         "queued",
-        json.dumps(metadata, ensure_ascii=False),
+        metadata,
     )
 
     queue_payload = {
@@ -619,17 +855,19 @@ async def upload_document(
         "traceId": trace_id,
         "storagePath": storage_path,
     }
-    await get_rabbitmq_client().publish_json(settings.rabbitmq_documents_queue, queue_payload)
-
-    await get_redis_client().set_json(
-        f"{settings.redis_key_prefix}:task:{task_id}",
-        {
-            "taskId": task_id,
-            "documentId": document_id,
-            "status": "queued",
-            "traceId": trace_id,
-        },
-        ttl_seconds=3600,
+    # 投递队列和写任务状态互不依赖，并发发出；文档行已先落库，Worker 消费时一定查得到
+    await asyncio.gather(
+        get_rabbitmq_client().publish_json(settings.rabbitmq_documents_queue, queue_payload),
+        get_redis_client().set_json(
+            f"{settings.redis_key_prefix}:task:{task_id}",
+            {
+                "taskId": task_id,
+                "documentId": document_id,
+                "status": "queued",
+                "traceId": trace_id,
+            },
+            ttl_seconds=3600,
+        ),
     )
 
     return success(
@@ -650,48 +888,34 @@ async def list_documents(
     request: Request,
     limit: int = Query(default=50, ge=1, le=200),
     status: str | None = Query(default=None, max_length=32),
+    with_total: bool = Query(default=True, alias="withTotal"),
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
 
     normalized_status = status.strip() if status else ""
 
-    conditions = ["deleted_at IS NULL"]
     args: list[Any] = []
     if normalized_status:
         args.append(normalized_status)
-        conditions.append(f"status = ${len(args)}")
-
-    where_clause = "WHERE " + " AND ".join(conditions)
-    count_sql = f"""
-        SELECT COUNT(1)
-        FROM documents
-        {where_clause}
-    """
-    total_count = await conn.fetchval(count_sql, *args)
 
-    args_with_limit = [*args, limit]
-    list_sql = f"""
-        SELECT
-            id::text AS document_id,
-            file_name,
-            source,
-            status,
-            metadata,
-            created_at,
-            updated_at
-        FROM documents
-        {where_clause}
-        ORDER BY created_at DESC
-        LIMIT ${len(args_with_limit)}
-    """
-    rows = await conn.fetch(list_sql, *args_with_limit)
+    # 总数要全表扫，不需要时（withTotal=false）整条 COUNT 跳过，列表只走一次索引范围读；
+    # 需要时总数和列表同一条 SQL 取回，不再分两次往返
+    total_count: int | None = None
+    if with_total:
+        list_sql = _LIST_DOCUMENTS_WITH_TOTAL_BY_STATUS_SQL if args else _LIST_DOCUMENTS_WITH_TOTAL_SQL
+        rows = await conn.fetch(list_sql, *args, limit)
+        total_count = int(rows[0]["total"] or 0) if rows else 0
+        rows = [row for row in rows if row["document_id"] is not None]
+    else:
+        list_sql = _LIST_DOCUMENTS_BY_STATUS_SQL if args else _LIST_DOCUMENTS_SQL
+        rows = await conn.fetch(list_sql, *args, limit)
     items = [_to_document_item(row) for row in rows]
 
     return success(
         {
             "items": items,
-            "total": int(total_count or 0),
+            "total": total_count,
         },
         trace_id,
     )
@@ -703,25 +927,9 @@ async def get_document_status(
     document_id: str = Path(min_length=8, max_length=64),
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
 
-    row = await conn.fetchrow(
-        """
-        SELECT
-            id::text AS document_id,
-            file_name,
-            source,
-            status,
-            metadata,
-            created_at,
-            updated_at
-        FROM documents
-        WHERE id::text = $1
-          AND deleted_at IS NULL
-        LIMIT 1
-        """,
-        document_id,
-    )
+    row = await conn.fetchrow(_GET_DOCUMENT_SQL, document_id)
     if not row:
         raise HTTPException(status_code=404, detail="文档不存在")
 
@@ -746,52 +954,43 @@ async def get_document_detail(
     document_id: str = Path(min_length=8, max_length=64),
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
 
-    row = await conn.fetchrow(
-        """
-        SELECT
-            id::text AS document_id,
-            file_name,
-            source,
-            status,
-            metadata,
-            created_at,
-            updated_at
-        FROM documents
-        WHERE id::text = $1
-          AND deleted_at IS NULL
-        LIMIT 1
-        """,
-        document_id,
-    )
+    row = await conn.fetchrow(_GET_DOCUMENT_SQL, document_id)
     if not row:
         raise HTTPException(status_code=404, detail="文档不存在")
 
     return success(_to_document_item(row), trace_id)
 
 
+def _resolve_stored_file(storage_path_raw: str) -> tuple[FsPath, os.stat_result]:
+    """解析原文件路径并校验在上传目录内，一次 stat 同时判断存在性和是否普通文件"""
+    try:
+        storage_path = FsPath(storage_path_raw).expanduser().resolve()
+        uploads_root = _uploads_root()
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="文档文件路径非法") from exc
+
+    if uploads_root not in storage_path.parents and storage_path != uploads_root:
+        raise HTTPException(status_code=400, detail="文档文件路径非法")
+    try:
+        stat_result = storage_path.stat()
+    except OSError as exc:
+        raise HTTPException(status_code=404, detail="文档原文件不存在") from exc
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="文档原文件不存在")
+    return storage_path, stat_result
+
+
 @router.get("/{document_id}/file")
 async def preview_document_file(
     request: Request,
     document_id: str = Path(min_length=8, max_length=64),
     conn=Depends(get_db_conn),
 ):
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
 
-    row = await conn.fetchrow(
-        """
-        SELECT
-            id::text AS document_id,
-            file_name,
-            metadata
-        FROM documents
-        WHERE id::text = $1
-          AND deleted_at IS NULL
-        LIMIT 1
-        """,
-        document_id,
-    )
+    row = await conn.fetchrow(_GET_DOCUMENT_FILE_SQL, document_id)
     if not row:
         raise HTTPException(status_code=404, detail="文档不存在")
 
@@ -800,16 +999,8 @@ async def preview_document_file(
     if not storage_path_raw:
         raise HTTPException(status_code=404, detail="文档原文件不存在")
 
-    try:
-        storage_path = FsPath(storage_path_raw).expanduser().resolve()
-        uploads_root = settings.documents_upload_path.expanduser().resolve()
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="文档文件路径非法") from exc
-
-    if uploads_root not in storage_path.parents and storage_path != uploads_root:
-        raise HTTPException(status_code=400, detail="文档文件路径非法")
-    if not storage_path.exists() or not storage_path.is_file():
-        raise HTTPException(status_code=404, detail="文档原文件不存在")
+    # resolve/stat 都是阻塞的文件系统调用，一起丢到线程池里做
+    storage_path, stat_result = await asyncio.to_thread(_resolve_stored_file, storage_path_raw)
 
     file_name = str(row["file_name"] or storage_path.name or "document")
     media_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
@@ -818,7 +1009,8 @@ async def preview_document_file(
         "x-trace-id": trace_id,
         "content-disposition": f"inline; filename*=UTF-8''{encoded_name}",
     }
-    return FileResponse(path=storage_path, media_type=media_type, headers=headers)
+    # 已经 stat 过，直接交给 FileResponse，不让它再 stat 一次
+    return FileResponse(path=storage_path, media_type=media_type, headers=headers, stat_result=stat_result)
 
 
 @router.post("/import-from-tool-run")
@@ -827,23 +1019,10 @@ async def import_document_from_tool_run(
     request: Request,
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     normalized_strategy = _normalize_strategy(payload.strategy)
 
-    run_row = await conn.fetchrow(
-        """
-        SELECT
-            id,
-            trace_id,
-            tool_name,
-            status,
-            output_payload
-        FROM tool_runs
-        WHERE id = $1
-        LIMIT 1
-        """,
-        payload.toolRunId,
-    )
+    run_row = await conn.fetchrow(_GET_TOOL_RUN_SQL, payload.toolRunId)
     if not run_row:
         raise HTTPException(status_code=404, detail="toolRun 不存在")
     if run_row["status"] != "success":
@@ -859,7 +1038,8 @@ async def import_document_from_tool_run(
     document_id = str(uuid4())
     task_id = f"task-{uuid4()}"
     tags = [item.strip() for item in payload.tags if item and item.strip()][:20]
-    markdown = "\n".join(
+    # 只编码一次：同一份 bytes 既用来算大小也直接落盘
+    markdown_bytes = "\n".join(
         [
             f"# {title or payload.title}",
             "",
@@ -872,11 +1052,11 @@ async def import_document_from_tool_run(
             excerpt,
             "",
         ]
-    )
+    ).encode("utf-8")
 
     file_name = _sanitize_file_name(f"{title or 'tool-import'}.md")
-    storage_path = _save_text_file(document_id, file_name, markdown)
-    file_size = len(markdown.encode("utf-8"))
+    storage_path = _save_bytes_file(document_id, file_name, markdown_bytes)
+    file_size = len(markdown_bytes)
     metadata = {
         "taskId": task_id,
         "strategy": normalized_strategy,
@@ -889,15 +1069,12 @@ async def import_document_from_tool_run(
     }
 
     await conn.execute(
-        """
-        INSERT INTO documents (id, file_name, source, status, metadata)
-        VALUES ($1::uuid, $2, $3, $4, $5::jsonb)
-        """,
+        _INSERT_DOCUMENT_SQL,
         document_id,
         file_name,
         "tool_run_import",
         "queued",
-        json.dumps(metadata, ensure_ascii=False),
+        metadata,
     )
 
     queue_payload = {
@@ -909,17 +1086,19 @@ async def import_document_from_tool_run(
         "traceId": trace_id,
         "storagePath": storage_path,
     }
-    await get_rabbitmq_client().publish_json(settings.rabbitmq_documents_queue, queue_payload)
-    await get_redis_client().set_json(
-        f"{settings.redis_key_prefix}:task:{task_id}",
-        {
-            "taskId": task_id,
-            "documentId": document_id,
-            "status": "queued",
-            "traceId": trace_id,
-            "sourceToolRunId": payload.toolRunId,
-        },
-        ttl_seconds=3600,
+    await asyncio.gather(
+        get_rabbitmq_client().publish_json(settings.rabbitmq_documents_queue, queue_payload),
+        get_redis_client().set_json(
+            f"{settings.redis_key_prefix}:task:{task_id}",
+            {
+                "taskId": task_id,
+                "documentId": document_id,
+                "status": "queued",
+                "traceId": trace_id,
+                "sourceToolRunId": payload.toolRunId,
+            },
+            ttl_seconds=3600,
+        ),
     )
 
     return success(
@@ -938,7 +1117,7 @@ async def import_document_from_tool_run(
 
 @router.post("/split-preview")
 def split_preview(payload: SplitPreviewRequest, request: Request) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     normalized_strategy = _normalize_strategy(payload.strategy)
     chunks = _split_text(
         payload.content,
@@ -963,17 +1142,9 @@ async def delete_document(
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
     """软删除文档"""
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
-
-    row = await conn.fetchrow(
-        """
-        UPDATE documents
-        SET deleted_at = NOW(), updated_at = NOW()
-        WHERE id::text = $1 AND deleted_at IS NULL
-        RETURNING id::text AS document_id, file_name
-        """,
-        document_id,
-    )
+    trace_id = get_trace_id(request)
+
+    row = await conn.fetchrow(_SOFT_DELETE_DOCUMENT_SQL, document_id)
 
     if not row:
         raise HTTPException(status_code=404, detail="文档不存在或已被删除")
@@ -1004,102 +1175,35 @@ async def get_document_chunks(
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
     """获取文档的分块列表"""
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
-
-    # 检查文档是否存在
-    doc_row = await conn.fetchrow(
-        """
-        SELECT id::text AS document_id, file_name, status
-        FROM documents
-        WHERE id::text = $1 AND deleted_at IS NULL
-        """,
-        document_id,
-    )
+    trace_id = get_trace_id(request)
 
-    if not doc_row:
+    rows = await conn.fetch(_LIST_DOCUMENT_CHUNKS_SQL, document_id, limit, offset)
+    if not rows:
         raise HTTPException(status_code=404, detail="文档不存在")
 
-    # 获取分块总数
-    total_count = await conn.fetchval(
-        """
-        SELECT COUNT(1)
-        FROM document_chunks
-        WHERE document_id = $1
-        """,
-        doc_row["document_id"],
-    )
-
-    # 获取分块列表
-    rows = await conn.fetch(
-        """
-        SELECT
-            id::text AS chunk_id,
-            chunk_index,
-            content,
-            token_count,
-            metadata,
-            created_at
-        FROM document_chunks
-        WHERE document_id = $1
-        ORDER BY chunk_index ASC
-        LIMIT $2 OFFSET $3
-        """,
-        doc_row["document_id"],
-        limit,
-        offset,
-    )
-
-    chunks: list[dict[str, Any]] = []
-    for row in rows:
-        metadata = _parse_metadata(row["metadata"])
-        node_id = metadata.get("nodeId") or metadata.get("node_id")
-        node_path = metadata.get("nodePath") or metadata.get("node_path")
-        level = metadata.get("level")
-        page_start = metadata.get("pageStart") or metadata.get("page_start")
-        page_end = metadata.get("pageEnd") or metadata.get("page_end")
-        char_start = metadata.get("charStart") or metadata.get("char_start")
-        char_end = metadata.get("charEnd") or metadata.get("char_end")
-        section_title = metadata.get("sectionTitle") or metadata.get("section_title")
+    doc_row = rows[0]
+    total_count = doc_row["total"]
+    rows = [row for row in rows if row["chunk_id"] is not None]
 
-        try:
-            level = int(level) if level is not None else None
-        except Exception:
-            level = None
-        try:
-            page_start = int(page_start) if page_start is not None else None
-        except Exception:
-            page_start = None
-        try:
-            page_end = int(page_end) if page_end is not None else None
-        except Exception:
-            page_end = None
-        try:
-            char_start = int(char_start) if char_start is not None else None
-        except Exception:
-            char_start = None
-        try:
-            char_end = int(char_end) if char_end is not None else None
-        except Exception:
-            char_end = None
-
-        chunks.append(
-            {
-                "chunkId": row["chunk_id"],
-                "chunkIndex": row["chunk_index"],
-                "content": row["content"],
-                "tokenCount": row["token_count"] or 0,
-                "length": len(row["content"]) if row["content"] else 0,
-                "createdAt": row["created_at"].isoformat() if row["created_at"] else None,
-                "nodeId": node_id,
-                "nodePath": node_path,
-                "level": level,
-                "pageStart": page_start,
-                "pageEnd": page_end,
-                "charStart": char_start,
-                "charEnd": char_end,
-                "sectionTitle": section_title,
-            }
-        )
+    chunks = [
+        {
+            "chunkId": row["chunk_id"],
+            "chunkIndex": row["chunk_index"],
+            "content": row["content"],
+            "tokenCount": row["token_count"] or 0,
+            "length": len(row["content"]) if row["content"] else 0,
+            "createdAt": row["created_at"].isoformat() if row["created_at"] else None,
+            "nodeId": row["node_id"],
+            "nodePath": row["node_path"],
+            "level": row["level"],
+            "pageStart": row["page_start"],
+            "pageEnd": row["page_end"],
+            "charStart": row["char_start"],
+            "charEnd": row["char_end"],
+            "sectionTitle": row["section_title"],
+        }
+        for row in rows
+    ]
 
     return success(
         {
@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import APIRouter, Request
 
 from app.core.database import ping_database
@@ -14,7 +16,9 @@ async def get_health(request: Request) -> dict[str, object]:
     if not trace_id:
         trace_id = "health-check"
 
-    postgres_ok, redis_ok, rabbitmq_ok = await ping_database(), await ping_redis(), await ping_rabbitmq()
+    # 三个探测互不依赖，并发发出，耗时取最慢的那个而不是三者之和；探测抛异常一律按 down 处理
+    results = await asyncio.gather(ping_database(), ping_redis(), ping_rabbitmq(), return_exceptions=True)
+    postgres_ok, redis_ok, rabbitmq_ok = (result is True for result in results)
     service_status = {
         "postgres": "ok" if postgres_ok else "down",
         "redis": "ok" if redis_ok else "down",
@@ -1,16 +1,13 @@
-from uuid import uuid4
-
 from fastapi import APIRouter, Depends, HTTPException, Path, Request
 from pydantic import BaseModel, Field
 
 from app.core.database import get_db_conn
-from app.core.response import success
+from app.core.response import get_trace_id, success
 from app.domain.mcp.gateway import get_mcp_gateway
 from app.domain.mcp.registry import (
     create_mcp_server,
-    ensure_builtin_tools,
+    ensure_and_list_mcp_tools,
     list_mcp_servers,
-    list_mcp_tools,
     set_mcp_tool_enabled,
     update_mcp_server,
 )
@@ -68,7 +65,7 @@ def _tool_to_dict(tool) -> dict[str, object]:
 
 @router.get("/servers")
 async def get_mcp_servers(request: Request, conn=Depends(get_db_conn)) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     servers = await list_mcp_servers(conn)
     return success({"items": [_server_to_dict(item) for item in servers]}, trace_id)
 
@@ -79,7 +76,7 @@ async def add_mcp_server(
     request: Request,
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     try:
         created = await create_mcp_server(conn, payload.model_dump())
     except ValueError as exc:
@@ -97,7 +94,7 @@ async def patch_mcp_server(
     server_key: str = Path(min_length=2, max_length=64),
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     try:
         updated = await update_mcp_server(
             conn,
@@ -113,9 +110,8 @@ async def patch_mcp_server(
 
 @router.get("/tools")
 async def get_mcp_tools(request: Request, conn=Depends(get_db_conn)) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
-    await ensure_builtin_tools(conn)
-    tools = await list_mcp_tools(conn)
+    trace_id = get_trace_id(request)
+    tools = await ensure_and_list_mcp_tools(conn)
     return success({"items": [_tool_to_dict(item) for item in tools]}, trace_id)
 
 
@@ -126,7 +122,7 @@ async def patch_mcp_tool_status(
     tool_name: str = Path(min_length=2, max_length=128),
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     try:
         updated = await set_mcp_tool_enabled(conn, tool_name, payload.enabled)
     except KeyError as exc:
@@ -142,7 +138,7 @@ async def sync_mcp_server_tools(
     server_key: str = Path(min_length=2, max_length=64),
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     gateway = get_mcp_gateway()
     try:
         synced = await gateway.discover_external_tools(conn, server_key=server_key)
@@ -1,11 +1,10 @@
 import logging
 import time
-from uuid import uuid4
 
 from fastapi import APIRouter, HTTPException, Path, Request
 from pydantic import BaseModel, Field
 
-from app.core.response import success
+from app.core.response import get_trace_id, success
 from app.domain.embedding import get_embedding_service
 from app.domain.models_registry import (
     create_model,
@@ -15,6 +14,7 @@ from app.domain.models_registry import (
     update_model,
     update_model_status,
 )
+from app.domain.rag_service import get_rag_service
 
 router = APIRouter(prefix="/models", tags=["models"])
 logger = logging.getLogger(__name__)
@@ -38,18 +38,19 @@ class UpdateStatusRequest(BaseModel):
     status: str = Field(pattern="^(online|offline)$")
 
 
+# 纯内存读取不会阻塞事件循环，直接用 async 避免线程池切换
 @router.get("")
-def get_models(request: Request) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+async def get_models(request: Request) -> dict[str, object]:
+    trace_id = get_trace_id(request)
     return success({"items": list_models()}, trace_id)
 
 
 @router.get("/{model_id}")
-def get_model_detail(
+async def get_model_detail(
     request: Request,
     model_id: str = Path(min_length=2, max_length=64),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     try:
         model = get_model_info(model_id)
     except KeyError as exc:
@@ -72,7 +73,7 @@ def get_model_detail(
 
 @router.post("")
 def add_model(payload: CreateModelRequest, request: Request) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     try:
         created = create_model(payload.model_dump())
     except ValueError as exc:
@@ -86,7 +87,7 @@ def edit_model(
     request: Request,
     model_id: str = Path(min_length=2, max_length=64),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     try:
         updated = update_model(model_id, payload.model_dump())
     except KeyError as exc:
@@ -102,7 +103,7 @@ def edit_model_status(
     request: Request,
     model_id: str = Path(min_length=2, max_length=64),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     try:
         updated = update_model_status(model_id, payload.status)
     except KeyError as exc:
@@ -117,7 +118,7 @@ def remove_model(
     request: Request,
     model_id: str = Path(min_length=2, max_length=64),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     try:
         removed = delete_model(model_id)
     except KeyError as exc:
@@ -139,7 +140,7 @@ async def test_model_connection(
     model_id: str = Path(min_length=2, max_length=64),
 ) -> dict[str, object]:
     """测试模型连接是否正常"""
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
 
     try:
         model = get_model_info(model_id)
@@ -182,19 +183,12 @@ async def test_model_connection(
 
 async def _test_chat_model(model, trace_id: str) -> dict[str, object]:
     """测试 Chat 模型连接"""
-    from openai import AsyncAzureOpenAI
-
-    from app.core.config import get_settings
-
-    settings = get_settings()
     start_time = time.monotonic()
 
     try:
-        client = AsyncAzureOpenAI(
-            api_key=model.api_key,
-            azure_endpoint=model.base_url,
-            api_version=settings.azure_openai_api_version,
-        )
+        # 复用问答链路按 (base_url, api_key) 缓存的客户端，反复测试时不再每次新建连接池、重做 TLS 握手；
+        # 与 embedding 测试走 embedding 服务的客户端缓存是同一个思路
+        client = get_rag_service().get_chat_client(model)
 
         # 发送一个简单的测试请求
         response = await client.chat.completions.create(
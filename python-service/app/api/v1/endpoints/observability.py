@@ -1,12 +1,11 @@
 from collections import defaultdict
 import json
 from typing import Any
-from uuid import uuid4
 
 from fastapi import APIRouter, Depends, Query, Request
 
 from app.core.database import get_db_conn
-from app.core.response import success
+from app.core.response import get_trace_id, success
 
 router = APIRouter(prefix="/observability", tags=["observability"])
 
@@ -48,7 +47,7 @@ async def get_consumption_logs(
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
     """查询 Prompt Token 消耗和 MCP skill 调用日志"""
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
 
     conditions: list[str] = []
     args: list[Any] = []
@@ -186,7 +185,7 @@ async def get_tool_runs(
     status: str | None = Query(default=None, pattern="^(success|failed)$"),
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
 
     conditions: list[str] = []
     args: list[Any] = []
@@ -259,7 +258,7 @@ async def get_deep_think_runs(
     stage: str | None = Query(default=None),
     conn=Depends(get_db_conn),
 ) -> dict[str, object]:
-    trace_id = request.headers.get("x-trace-id") or str(uuid4())
+    trace_id = get_trace_id(request)
     args: list[Any] = []
     where_clause = ""
     if stage:
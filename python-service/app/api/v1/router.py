@@ -6,6 +6,14 @@ api_router = APIRouter(prefix="/api/v1")
 api_router.include_router(health.router)
 api_router.include_router(models.router)
 api_router.include_router(chat.router)
+# 原生 Starlette 路由不会继承 APIRouter 的 prefix，这里显式拼出完整路径
+for method, path, endpoint in chat.RAW_ROUTES:
+    api_router.add_route(
+        f"{api_router.prefix}{chat.router.prefix}{path}",
+        endpoint,
+        methods=[method],
+        include_in_schema=False,
+    )
 api_router.include_router(documents.router)
 api_router.include_router(observability.router)
 api_router.include_router(mcp.router)
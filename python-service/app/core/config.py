@@ -20,6 +20,9 @@ class Settings(BaseSettings):
     postgres_password: str = "rag_pass"
     postgres_min_pool_size: int = 2
     postgres_max_pool_size: int = 10
+    # 每个连接的预编译语句缓存：会话/消息接口的 SQL 都是模块常量，按文本命中缓存
+    postgres_statement_cache_size: int = 256
+    postgres_max_cacheable_statement_size: int = 16 * 1024
 
     # Redis 配置
     redis_host: str = "localhost"
@@ -69,6 +72,9 @@ class Settings(BaseSettings):
     document_worker_overlap: int = 50
     document_worker_embedding_model_id: str = "text-embedding-3-large"
 
+    # 聊天落库 Worker 配置（会话/消息/可观测日志在响应后异步写入）
+    chat_persist_queue_size: int = 1000
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
     @property
@@ -1,8 +1,9 @@
 import logging
-from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack, asynccontextmanager
 from typing import AsyncGenerator
 
 import asyncpg
+import orjson
 from pgvector.asyncpg import register_vector
 
 from app.core.config import get_settings
@@ -10,6 +11,18 @@ from app.core.config import get_settings
 logger = logging.getLogger(__name__)
 
 
+_JSONB_BINARY_VERSION = b"\x01"
+
+
+def _encode_jsonb(value: object) -> bytes:
+    """jsonb 二进制格式：1 字节版本号 + UTF-8 JSON；中文原样保留，非字符串 key（比如 int）按字符串写入"""
+    return _JSONB_BINARY_VERSION + orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _decode_jsonb(data: bytes) -> object:
+    return orjson.loads(memoryview(data)[1:])
+
+
 class DatabasePool:
     """PostgreSQL 连接池管理器"""
 
@@ -30,6 +43,8 @@ class DatabasePool:
             password=settings.postgres_password,
             min_size=settings.postgres_min_pool_size,
             max_size=settings.postgres_max_pool_size,
+            statement_cache_size=settings.postgres_statement_cache_size,
+            max_cacheable_statement_size=settings.postgres_max_cacheable_statement_size,
             init=self._init_connection,
         )
         logger.info(
@@ -41,8 +56,22 @@ class DatabasePool:
         await self._ensure_observability_schema()
 
     async def _init_connection(self, conn: asyncpg.Connection) -> None:
-        """初始化数据库连接，注册 pgvector 类型"""
+        """
+        初始化数据库连接，注册 pgvector 类型和 jsonb 编解码
+
+        说明：
+        - jsonb 统一走 orjson + 二进制格式：写入直接传 dict/list/dataclass，读出直接拿到 dict/list，
+          中间不产生 Python str。
+        - 参数不要再提前 json.dumps，否则字符串会被当成 JSON 字符串二次编码。
+        """
         await register_vector(conn)
+        await conn.set_type_codec(
+            "jsonb",
+            encoder=_encode_jsonb,
+            decoder=_decode_jsonb,
+            schema="pg_catalog",
+            format="binary",
+        )
 
     async def _ensure_observability_schema(self) -> None:
         """运行时兜底：补齐可观测字段与表，兼容旧库"""
@@ -210,6 +239,16 @@ class DatabasePool:
         chat_index_statements = [
             "CREATE INDEX IF NOT EXISTS idx_chat_sessions_session_id ON chat_sessions(session_id)",
             "CREATE INDEX IF NOT EXISTS idx_chat_sessions_created_at ON chat_sessions(created_at DESC)",
+            # 会话列表按 (updated_at DESC, session_id DESC) 游标翻页，INCLUDE 列表字段走仅索引扫描。
+            # 启动时和其他索引一样普通建：CONCURRENTLY 要等表上所有事务结束，会卡住启动，
+            # 中途被打断还会留下 INVALID 索引，IF NOT EXISTS 之后永远跳过它。
+            # 已有大库补建：先手动 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chat_sessions_updated_at
+            #   ON chat_sessions(updated_at DESC, session_id DESC) INCLUDE (model_id, title, use_rag, created_at);
+            (
+                "CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated_at "
+                "ON chat_sessions(updated_at DESC, session_id DESC) "
+                "INCLUDE (model_id, title, use_rag, created_at)"
+            ),
             "CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id)",
             "CREATE INDEX IF NOT EXISTS idx_chat_messages_created_at ON chat_messages(created_at)",
         ]
@@ -278,6 +317,25 @@ async def db_conn_context() -> AsyncGenerator[asyncpg.Connection, None]:
         yield conn
 
 
+@asynccontextmanager
+async def optional_db_conn_context() -> AsyncGenerator[asyncpg.Connection | None, None]:
+    """
+    上下文管理器方式获取可选连接（给不走依赖注入的原生路由使用）
+
+    说明：
+    - 与 get_optional_db_conn 语义一致，DB 不可用时返回 None。
+    - 只兜底连接获取失败，业务代码抛出的异常原样向上传递。
+    """
+    stack = AsyncExitStack()
+    try:
+        conn = await stack.enter_async_context(_db_pool.get_connection())
+    except Exception:
+        logger.warning("Optional DB connection unavailable, fallback to non-RAG mode")
+        conn = None
+    async with stack:
+        yield conn
+
+
 async def get_db_conn() -> AsyncGenerator[asyncpg.Connection, None]:
     """FastAPI 依赖注入：获取数据库连接"""
     async with _db_pool.get_connection() as conn:
@@ -1,9 +1,9 @@
-import json
 import logging
 from datetime import UTC, datetime
 from typing import Any
 
 import aio_pika
+import orjson
 from aio_pika.abc import AbstractChannel, AbstractConnection
 
 from app.core.config import get_settings
@@ -56,7 +56,7 @@ class RabbitMQClient:
         if self._channel is None or self._channel.is_closed:
             raise RuntimeError("RabbitMQ channel not initialized")
 
-        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        body = orjson.dumps(payload)
         message = aio_pika.Message(
             body=body,
             content_type="application/json",
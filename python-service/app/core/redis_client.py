@@ -1,7 +1,7 @@
-import json
 import logging
 from typing import Any
 
+import orjson
 import redis.asyncio as redis
 
 from app.core.config import get_settings
@@ -47,7 +47,7 @@ class RedisClient:
     async def set_json(self, key: str, value: dict[str, Any], ttl_seconds: int | None = None) -> None:
         if self._client is None:
             raise RuntimeError("Redis client not initialized")
-        payload = json.dumps(value, ensure_ascii=False)
+        payload = orjson.dumps(value)
         if ttl_seconds is None:
             await self._client.set(key, payload)
         else:
@@ -59,7 +59,7 @@ class RedisClient:
         payload = await self._client.get(key)
         if not payload:
             return None
-        return json.loads(payload)
+        return orjson.loads(payload)
 
 
 _redis_client = RedisClient()
@@ -1,5 +1,24 @@
+from secrets import token_hex
 from typing import Any
 
+from fastapi import Request
+from fastapi.responses import ORJSONResponse
+
+
+def get_trace_id(request: Request) -> str:
+    """
+    读取请求链路 ID，缺省时生成新的
+
+    说明：
+    - ASGI 规范保证 scope 里的 header 名已是小写 bytes，直接逐个比较即可，
+      不用为一次查找构造 Starlette 的 Headers 视图。
+    - 缺省时用 token_hex(16)：与 uuid4 同样 128 位随机，省掉 UUID 对象构造和带连字符的格式化。
+    """
+    for key, value in request.scope["headers"]:
+        if key == b"x-trace-id" and value:
+            return value.decode("latin-1")
+    return token_hex(16)
+
 
 def success(data: Any, trace_id: str, message: str = "ok") -> dict[str, Any]:
     return {
@@ -17,3 +36,15 @@ def fail(trace_id: str, message: str, code: int = 1, data: Any = None) -> dict[s
         "data": data,
         "traceId": trace_id,
     }
+
+
+def success_response(data: Any, trace_id: str, message: str = "ok") -> ORJSONResponse:
+    """
+    成功响应（直接序列化版本）
+
+    说明：
+    - 绕过 FastAPI 的 response_model 校验与 jsonable_encoder，由 orjson 一次编码。
+    - 约定：data 里只能放 str/int/float/bool/None/list/dict 和 dataclass，
+      datetime 需先转成 isoformat 字符串，否则不会再有兜底转换。
+    """
+    return ORJSONResponse(success(data, trace_id, message))
@@ -25,16 +25,22 @@ class EmbeddingService:
     def __init__(self) -> None:
         self._settings = get_settings()
         self._client: AsyncAzureOpenAI | None = None
+        self._model_clients: dict[tuple[str, str], AsyncAzureOpenAI] = {}
 
     def _get_client(self, model: ModelInfo | None = None) -> AsyncAzureOpenAI:
         """获取 Azure OpenAI 客户端"""
         if model and model.base_url and model.api_key:
-            # 使用模型注册表中的配置
-            return AsyncAzureOpenAI(
-                api_key=model.api_key,
-                azure_endpoint=model.base_url,
-                api_version=self._settings.azure_openai_api_version,
-            )
+            # 使用模型注册表中的配置，按 (base_url, api_key) 复用客户端，避免每次请求重建连接池
+            key = (model.base_url, model.api_key)
+            client = self._model_clients.get(key)
+            if client is None:
+                client = AsyncAzureOpenAI(
+                    api_key=model.api_key,
+                    azure_endpoint=model.base_url,
+                    api_version=self._settings.azure_openai_api_version,
+                )
+                self._model_clients[key] = client
+            return client
 
         # 使用默认配置
         if self._client is None:
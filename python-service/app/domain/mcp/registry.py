@@ -104,27 +104,52 @@ def _to_tool_info(row: asyncpg.Record) -> McpToolInfo:
     )
 
 
+# 内置工具整批 upsert：工具定义打成一个 jsonb 数组参数在库里展开，一条语句写完，不再每个工具一次往返
+_UPSERT_BUILTIN_TOOLS_SQL = """
+INSERT INTO mcp_tools (tool_name, display_name, description, source, server_key, tool_schema, enabled)
+SELECT tool.tool_name, tool.display_name, tool.description, tool.source, tool.server_key, tool.tool_schema, TRUE
+FROM jsonb_to_recordset($1) AS tool(
+    tool_name TEXT,
+    display_name TEXT,
+    description TEXT,
+    source TEXT,
+    server_key TEXT,
+    tool_schema JSONB
+)
+ON CONFLICT (tool_name) DO UPDATE
+SET
+  display_name = EXCLUDED.display_name,
+  description = EXCLUDED.description,
+  source = EXCLUDED.source,
+  tool_schema = EXCLUDED.tool_schema,
+  updated_at = NOW()
+"""
+
+# upsert 与列表合成一次往返。写入式 CTE 里改动的行对同一语句的 SELECT 不可见，
+# 所以内置工具取 RETURNING 的新值（enabled 保持库里原值），其余工具从表里读
+_ENSURE_AND_LIST_TOOLS_SQL = f"""
+WITH upserted AS (
+{_UPSERT_BUILTIN_TOOLS_SQL.strip()}
+RETURNING tool_name, display_name, description, source, server_key, tool_schema, enabled
+)
+SELECT tool_name, display_name, description, source, server_key, tool_schema, enabled
+FROM upserted
+UNION ALL
+SELECT tool_name, display_name, description, source, server_key, tool_schema, enabled
+FROM mcp_tools
+WHERE tool_name NOT IN (SELECT tool_name FROM upserted)
+ORDER BY source ASC, tool_name ASC
+"""
+
+
 async def ensure_builtin_tools(conn: asyncpg.Connection) -> None:
-    for tool in BUILTIN_TOOLS:
-        await conn.execute(
-            """
-            INSERT INTO mcp_tools (tool_name, display_name, description, source, server_key, tool_schema, enabled)
-            VALUES ($1, $2, $3, $4, $5, $6::jsonb, TRUE)
-            ON CONFLICT (tool_name) DO UPDATE
-            SET
-              display_name = EXCLUDED.display_name,
-              description = EXCLUDED.description,
-              source = EXCLUDED.source,
-              tool_schema = EXCLUDED.tool_schema,
-              updated_at = NOW()
-            """,
-            tool["tool_name"],
-            tool["display_name"],
-            tool["description"],
-            tool["source"],
-            tool["server_key"],
-            json.dumps(tool["tool_schema"], ensure_ascii=False),
-        )
+    await conn.execute(_UPSERT_BUILTIN_TOOLS_SQL, BUILTIN_TOOLS)
+
+
+async def ensure_and_list_mcp_tools(conn: asyncpg.Connection) -> list[McpToolInfo]:
+    """确保内置工具已登记并返回全部工具，一条 SQL 完成"""
+    rows = await conn.fetch(_ENSURE_AND_LIST_TOOLS_SQL, BUILTIN_TOOLS)
+    return [_to_tool_info(row) for row in rows]
 
 
 async def list_mcp_servers(conn: asyncpg.Connection) -> list[McpServerInfo]:
@@ -172,7 +197,7 @@ async def create_mcp_server(conn: asyncpg.Connection, payload: dict[str, Any]) -
         INSERT INTO mcp_servers (
             server_key, name, source_type, endpoint, auth_type, auth_config, enabled, timeout_ms
         )
-        VALUES ($1, $2, $3, $4, $5, $6::jsonb, TRUE, $7)
+        VALUES ($1, $2, $3, $4, $5, $6, TRUE, $7)
         RETURNING
             server_key,
             name,
@@ -188,7 +213,7 @@ async def create_mcp_server(conn: asyncpg.Connection, payload: dict[str, Any]) -
         source_type,
         endpoint,
         auth_type,
-        json.dumps(auth_config, ensure_ascii=False),
+        auth_config,
         timeout_ms,
     )
     if not row:
@@ -241,8 +266,8 @@ async def update_mcp_server(
         auth_config = payload.get("authConfig")
         if not isinstance(auth_config, dict):
             auth_config = {}
-        args.append(json.dumps(auth_config, ensure_ascii=False))
-        updates.append(f"auth_config = ${len(args)}::jsonb")
+        args.append(auth_config)
+        updates.append(f"auth_config = ${len(args)}")
 
     if not updates:
         raise ValueError("未提供可更新字段")
@@ -460,7 +485,7 @@ async def upsert_external_tool(
     row = await conn.fetchrow(
         """
         INSERT INTO mcp_tools (tool_name, display_name, description, source, server_key, tool_schema, enabled)
-        VALUES ($1, $2, $3, 'external', $4, $5::jsonb, TRUE)
+        VALUES ($1, $2, $3, 'external', $4, $5, TRUE)
         ON CONFLICT (tool_name) DO UPDATE
         SET
             display_name = EXCLUDED.display_name,
@@ -482,7 +507,7 @@ async def upsert_external_tool(
         display_name,
         description,
         server_key,
-        json.dumps(tool_schema or {}, ensure_ascii=False),
+        tool_schema or {},
     )
     if not row:
         raise RuntimeError("外部工具写入失败")
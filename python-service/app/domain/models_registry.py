@@ -62,6 +62,10 @@ class ModelRegistry:
         self._file_path = file_path
         self._lock = Lock()
         self._models: dict[str, ModelInfo] = {}
+        # (model_id, capability) 在线能力索引：每次变更后整体重建并原子替换，读路径无需加锁
+        self._online_capabilities: frozenset[tuple[str, str]] = frozenset()
+        # 列表接口的排序结果同样随变更重建：读多写极少，读路径不再逐次排序、转 dict、抢锁
+        self._model_list: tuple[dict[str, object], ...] = ()
         self._load()
 
     def _load(self) -> None:
@@ -73,6 +77,7 @@ class ModelRegistry:
                         raise ValueError("models file must be a list")
                     items = [self._normalize(raw) for raw in payload]
                     self._models = {item.model_id: item for item in items}
+                    self._reindex_unlocked()
                     return
                 except Exception:
                     self._models = {}
@@ -81,14 +86,24 @@ class ModelRegistry:
             self._models = {item.model_id: item for item in items}
             self._persist_unlocked()
 
-    def _persist_unlocked(self) -> None:
-        serialized = [
+    def _reindex_unlocked(self) -> None:
+        self._online_capabilities = frozenset(
+            (item.model_id, capability)
+            for item in self._models.values()
+            if item.status == "online"
+            for capability in item.capabilities
+        )
+        self._model_list = tuple(
             self._to_dict(item)
             for item in sorted(
                 self._models.values(),
                 key=lambda model: (model.provider.lower(), model.name.lower()),
             )
-        ]
+        )
+
+    def _persist_unlocked(self) -> None:
+        self._reindex_unlocked()
+        serialized = list(self._model_list)
         self._file_path.parent.mkdir(parents=True, exist_ok=True)
         self._file_path.write_text(
             json.dumps(serialized, ensure_ascii=False, indent=2),
@@ -162,14 +177,14 @@ class ModelRegistry:
         }
 
     def list_models(self) -> list[dict[str, object]]:
-        with self._lock:
-            return [
-                self._to_dict(item)
-                for item in sorted(
-                    self._models.values(),
-                    key=lambda model: (model.provider.lower(), model.name.lower()),
-                )
-            ]
+        """
+        按提供商、名称排序的模型列表
+
+        说明：
+        - 直接返回变更时预先排好的快照，元素 dict 在调用方之间共享，只读使用。
+        - 快照与能力索引一起重建，增删改后立刻生效，不需要 TTL。
+        """
+        return list(self._model_list)
 
     def create_model(self, payload: dict[str, object]) -> dict[str, object]:
         with self._lock:
@@ -208,11 +223,14 @@ class ModelRegistry:
             return deleted
 
     def model_supports(self, model_id: str, capability: str) -> bool:
-        with self._lock:
-            current = self._models.get(model_id)
-            if current is None:
-                return False
-            return current.status == "online" and capability in current.capabilities
+        """
+        判断模型是否在线且具备指定能力
+
+        说明：
+        - 问答热路径每次请求都会调用，这里只做一次 frozenset 命中判断，不抢锁。
+        - 索引在增删改时随持久化一起重建，不会读到过期结果。
+        """
+        return (model_id, capability) in self._online_capabilities
 
     def get_model(self, model_id: str) -> ModelInfo:
         """获取单个模型配置"""
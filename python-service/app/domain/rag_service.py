@@ -30,7 +30,7 @@ CHAT_SYSTEM_PROMPT = """你是一个专业、可靠的 AI 助手。
 """
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SkillCallLog:
     """单次 MCP skill 调用记录"""
 
@@ -55,6 +55,15 @@ class LlmGenerationUsage:
     total_tokens: int
 
 
+@dataclass(slots=True)
+class UsageStats:
+    """流式生成的 token 统计，调用方传入后由生成器原地写入"""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+
 @dataclass
 class RAGResponse:
     """RAG 问答响应"""
@@ -97,15 +106,27 @@ class RAGService:
     def __init__(self) -> None:
         self._settings = get_settings()
         self._client: AsyncAzureOpenAI | None = None
+        self._model_clients: dict[tuple[str, str], AsyncAzureOpenAI] = {}
 
-    def _get_chat_client(self, model: ModelInfo) -> AsyncAzureOpenAI:
-        """获取 Chat 客户端，优先读模型配置，其次读系统默认配置"""
+    def get_chat_client(self, model: ModelInfo) -> AsyncAzureOpenAI:
+        """
+        获取 Chat 客户端，优先读模型配置，其次读系统默认配置
+
+        说明：
+        - 按 (base_url, api_key) 缓存：新建客户端会同步加载 SSL 上下文、新开连接池，
+          每次请求都建会阻塞事件循环，也用不上 HTTP 连接复用。
+        """
         if model.base_url and model.api_key:
-            return AsyncAzureOpenAI(
-                api_key=model.api_key,
-                azure_endpoint=model.base_url,
-                api_version=self._settings.azure_openai_api_version,
-            )
+            key = (model.base_url, model.api_key)
+            client = self._model_clients.get(key)
+            if client is None:
+                client = AsyncAzureOpenAI(
+                    api_key=model.api_key,
+                    azure_endpoint=model.base_url,
+                    api_version=self._settings.azure_openai_api_version,
+                )
+                self._model_clients[key] = client
+            return client
 
         if self._client is None:
             self._client = AsyncAzureOpenAI(
@@ -364,11 +385,11 @@ class RAGService:
         question: str,
         model_id: str,
         registry: ModelRegistry,
-        usage_sink: dict[str, int] | None = None,
+        usage_sink: UsageStats | None = None,
     ) -> AsyncIterator[str]:
         """普通聊天流式输出（不走 embedding/向量检索）"""
         model = registry.get_model(model_id)
-        client = self._get_chat_client(model)
+        client = self.get_chat_client(model)
         deployment_name = model_id
 
         request_payload = {
@@ -390,18 +411,14 @@ class RAGService:
             # 兼容部分模型/网关不支持 include_usage 的情况
             stream = await client.chat.completions.create(**request_payload)
 
-        usage_stats = {
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "total_tokens": 0,
-        }
+        usage_stats = usage_sink if usage_sink is not None else UsageStats()
 
         async for chunk in stream:
             usage = getattr(chunk, "usage", None)
             if usage:
-                usage_stats["prompt_tokens"] = (usage.prompt_tokens or 0)
-                usage_stats["completion_tokens"] = (usage.completion_tokens or 0)
-                usage_stats["total_tokens"] = (usage.total_tokens or 0)
+                usage_stats.prompt_tokens = usage.prompt_tokens or 0
+                usage_stats.completion_tokens = usage.completion_tokens or 0
+                usage_stats.total_tokens = usage.total_tokens or 0
 
             if not chunk.choices:
                 continue
@@ -409,9 +426,6 @@ class RAGService:
             if delta:
                 yield delta
 
-        if usage_sink is not None:
-            usage_sink.update(usage_stats)
-
     def _build_context(self, results: list[SearchResult]) -> str:
         """构建上下文字符串"""
         if not results:
@@ -436,7 +450,7 @@ class RAGService:
     ) -> LlmGenerationUsage:
         """调用 LLM 生成回答，并返回 token 使用统计"""
         model = registry.get_model(model_id)
-        client = self._get_chat_client(model)
+        client = self.get_chat_client(model)
         deployment_name = model_id
         system_prompt = RAG_SYSTEM_PROMPT.format(context=context)
 
@@ -482,7 +496,7 @@ class RAGService:
     ) -> LlmGenerationUsage:
         """普通聊天模式（不带检索上下文）"""
         model = registry.get_model(model_id)
-        client = self._get_chat_client(model)
+        client = self.get_chat_client(model)
         deployment_name = model_id
 
         response = await client.chat.completions.create(
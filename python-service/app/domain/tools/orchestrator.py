@@ -7,26 +7,14 @@ import asyncpg
 from app.core.config import get_settings
 from app.domain.mcp.gateway import ToolInvokeResult, get_mcp_gateway
 from app.domain.mcp.registry import ensure_builtin_tools, get_mcp_tool
+from app.domain.rag_service import SkillCallLog
 from app.domain.tools.deep_think_pipeline import DeepThinkStageResult, run_deep_think_pipeline
 
 settings = get_settings()
 URL_PATTERN = re.compile(r"https?://[^\s]+", re.IGNORECASE)
 
 
-@dataclass
-class ToolSkillCall:
-    skill_name: str
-    status: str
-    latency_ms: int
-    prompt_tokens: int = 0
-    completion_tokens: int = 0
-    total_tokens: int = 0
-    input_summary: str = ""
-    output_summary: str = ""
-    error_message: str | None = None
-
-
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ToolRunRecord:
     tool_name: str
     source: str
@@ -41,7 +29,7 @@ class ToolRunRecord:
     error_message: str | None = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class DeepThinkRunRecord:
     stage: str
     status: str
@@ -55,7 +43,7 @@ class DeepThinkRunRecord:
 @dataclass
 class ToolOrchestrationResult:
     rewritten_question: str
-    skill_calls: list[ToolSkillCall]
+    skill_calls: list[SkillCallLog]
     tool_runs: list[ToolRunRecord]
     deep_think_summary: str | None
     deep_think_runs: list[DeepThinkRunRecord]
@@ -78,8 +66,8 @@ def _should_try_web_tool(question: str) -> bool:
     return any(word in lowered for word in keywords)
 
 
-def _to_skill_call(run: ToolInvokeResult) -> ToolSkillCall:
-    return ToolSkillCall(
+def _to_skill_call(run: ToolInvokeResult) -> SkillCallLog:
+    return SkillCallLog(
         skill_name=run.tool_name,
         status=run.status,
         latency_ms=run.latency_ms,
@@ -134,7 +122,7 @@ class ToolOrchestrator:
         if conn is not None:
             await ensure_builtin_tools(conn)
 
-        skill_calls: list[ToolSkillCall] = []
+        skill_calls: list[SkillCallLog] = []
         tool_runs: list[ToolRunRecord] = []
         deep_think_summary: str | None = None
         deep_think_runs: list[DeepThinkRunRecord] = []
@@ -153,7 +141,7 @@ class ToolOrchestrator:
                 # 用户没给 URL 但表达了“查看网页”，先不盲目抓全网，提示用户给 URL
                 if not candidate_urls:
                     skill_calls.append(
-                        ToolSkillCall(
+                        SkillCallLog(
                             skill_name="mcp.web.fetch",
                             status="failed",
                             latency_ms=0,
@@ -185,7 +173,7 @@ class ToolOrchestrator:
                     except Exception as exc:
                         error_msg = str(exc)
                         skill_calls.append(
-                            ToolSkillCall(
+                            SkillCallLog(
                                 skill_name="mcp.web.fetch",
                                 status="failed",
                                 latency_ms=0,
@@ -219,7 +207,7 @@ class ToolOrchestrator:
             deep_think_summary = deep_result.summary
             deep_think_runs = [_to_deep_run(stage) for stage in deep_result.stages]
             skill_calls.append(
-                ToolSkillCall(
+                SkillCallLog(
                     skill_name="mcp.deep_think.pipeline",
                     status="success",
                     latency_ms=sum(item.latency_ms for item in deep_think_runs),
@@ -209,7 +209,6 @@ class VectorStore:
         """
         chunk_id = uuid.uuid4()
         document_uuid = uuid.UUID(document_id)
-        metadata_payload = json.dumps(metadata or {}, ensure_ascii=False)
         normalized_embedding = self._normalize_embedding(embedding)
 
         async with conn.transaction():
@@ -217,27 +216,27 @@ class VectorStore:
             await conn.execute(
                 """
                 INSERT INTO documents (id, file_name, source, status, metadata)
-                VALUES ($1, $2, $3, $4, $5::jsonb)
+                VALUES ($1, $2, $3, $4, $5)
                 ON CONFLICT (id) DO NOTHING
                 """,
                 document_uuid,
                 f"auto-{document_id}",
                 "generated",
                 "processing",
-                "{}",
+                {},
             )
 
             # 插入分块
             await conn.execute(
                 """
                 INSERT INTO document_chunks (id, document_id, chunk_index, content, metadata)
-                VALUES ($1, $2, $3, $4, $5::jsonb)
+                VALUES ($1, $2, $3, $4, $5)
                 """,
                 chunk_id,
                 document_uuid,
                 chunk_index,
                 content,
-                metadata_payload,
+                metadata or {},
             )
 
             # 插入向量
@@ -12,6 +12,7 @@ from app.core.database import close_database, init_database
 from app.core.rabbitmq import close_rabbitmq, init_rabbitmq
 from app.core.redis_client import close_redis, init_redis
 from app.core.response import fail
+from app.workers.chat_persist_worker import start_chat_persist_worker, stop_chat_persist_worker
 from app.workers.document_worker import start_document_worker, stop_document_worker
 
 settings = get_settings()
@@ -25,11 +26,13 @@ async def lifespan(_: FastAPI):
     await init_redis()
     await init_rabbitmq()
     await start_document_worker()
+    await start_chat_persist_worker()
     logger.info("All dependencies initialized")
     try:
         yield
     finally:
         logger.info("Closing dependencies")
+        await stop_chat_persist_worker()
         await stop_document_worker()
         await close_rabbitmq()
         await close_redis()
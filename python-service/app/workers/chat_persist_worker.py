@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+import asyncpg
+
+from app.core.config import get_settings
+from app.core.database import db_conn_context
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class PersistJob:
+    """
+    一次响应后的落库任务
+
+    说明：
+    - Worker 跑在独立任务里，拿不到请求上下文，trace_id 必须显式带进来。
+    - write 拿到 Worker 的连接后自行完成会话/消息/日志写入。
+    """
+
+    trace_id: str
+    write: Callable[[asyncpg.Connection], Awaitable[None]]
+
+
+def _put_dropping_oldest(queue: asyncio.Queue[PersistJob | None], item: PersistJob | None) -> None:
+    while queue.full():
+        dropped = queue.get_nowait()
+        if dropped is not None:
+            logger.warning("[%s] Chat persist queue full, dropped oldest job", dropped.trace_id)
+    queue.put_nowait(item)
+
+
+class ChatPersistWorker:
+    """
+    聊天落库 Worker：请求侧只入队，单个后台任务顺序消费
+
+    说明：
+    - 队列有界，满了丢最旧的任务，DB 卡住时网关内存不会无限涨。
+    - 一次取到连接后把当前积压的任务一起写完，减少连接获取次数。
+    """
+
+    def __init__(self) -> None:
+        self._settings = get_settings()
+        self._queue: asyncio.Queue[PersistJob | None] | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._queue = asyncio.Queue(maxsize=max(int(self._settings.chat_persist_queue_size), 1))
+        self._task = asyncio.create_task(self._run(self._queue), name="chat-persist-worker")
+        logger.info("Chat persist worker task started")
+
+    async def stop(self) -> None:
+        if self._task is None or self._queue is None:
+            return
+        # 哨兵排在已入队任务之后，停机前先把积压写完
+        _put_dropping_oldest(self._queue, None)
+        try:
+            await self._task
+        except Exception:
+            logger.exception("Chat persist worker task exited with error")
+        self._task = None
+        self._queue = None
+        logger.info("Chat persist worker stopped")
+
+    def submit(self, job: PersistJob) -> bool:
+        """入队；Worker 未启动时返回 False，由调用方自行兜底"""
+        if self._task is None or self._task.done() or self._queue is None:
+            return False
+        _put_dropping_oldest(self._queue, job)
+        return True
+
+    async def _run(self, queue: asyncio.Queue[PersistJob | None]) -> None:
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            pending = [job]
+            stopping = False
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                pending.append(item)
+            await self._write_batch(pending)
+            if stopping:
+                return
+
+    async def _write_batch(self, jobs: list[PersistJob]) -> None:
+        try:
+            async with db_conn_context() as conn:
+                for job in jobs:
+                    try:
+                        await job.write(conn)
+                    except Exception:
+                        logger.exception("[%s] Chat persist job failed", job.trace_id)
+        except Exception:
+            logger.warning(
+                "Chat persist skipped: db unavailable, dropped %d job(s), trace_ids=%s",
+                len(jobs),
+                ",".join(job.trace_id for job in jobs),
+            )
+
+
+_chat_persist_worker = ChatPersistWorker()
+
+
+def submit_persist_job(job: PersistJob) -> bool:
+    return _chat_persist_worker.submit(job)
+
+
+async def start_chat_persist_worker() -> None:
+    await _chat_persist_worker.start()
+
+
+async def stop_chat_persist_worker() -> None:
+    await _chat_persist_worker.stop()
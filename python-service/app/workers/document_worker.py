@@ -1,5 +1,4 @@
 import asyncio
-import json
 import logging
 from datetime import UTC, datetime
 from pathlib import Path
@@ -7,6 +6,7 @@ from typing import Any
 
 import aio_pika
 import asyncpg
+import orjson
 from aio_pika.abc import AbstractIncomingMessage
 
 from app.api.v1.endpoints.documents import _normalize_strategy, _split_text
@@ -99,7 +99,7 @@ class DocumentWorker:
     async def _on_message(self, message: AbstractIncomingMessage) -> None:
         async with message.process(requeue=False):
             try:
-                payload = json.loads(message.body.decode("utf-8"))
+                payload = orjson.loads(message.body)
                 if not isinstance(payload, dict):
                     raise ValueError("queue payload 必须是 JSON 对象")
             except Exception as exc:
@@ -187,7 +187,7 @@ class DocumentWorker:
             """,
             document_id,
             status,
-            json.dumps(metadata_patch, ensure_ascii=False),
+            metadata_patch,
         )
 
     @staticmethod